@@ -0,0 +1,225 @@
+import json
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+from typing import List, Literal, Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+from utils import serving
+from utils.config import HedgingConfig, ServingConfig
+from utils.get_prompt import get_documents, rerank
+
+logger = logging.getLogger(__name__)
+
+
+class RetrieveRequest(BaseModel):
+    query: str
+    k: int = 20
+    fusion: Optional[Literal["dense", "rrf", "weighted"]] = None
+
+
+class RerankRequest(BaseModel):
+    query: str
+    ids: List[int]
+    k: int = 8
+
+
+class DocumentsRequest(BaseModel):
+    query: str
+
+
+class AnswerRequest(BaseModel):
+    query: str
+    model: str = "GigaChat"
+
+
+class ChatRequest(BaseModel):
+    query: str
+    models: List[str] = ["GigaChat", "Mistral"]
+    hedged: bool = False
+
+
+class Worker:
+    """
+    Everything heavy is loaded once per server process. Retrieval and generation each have a limit of
+    concurrent requests; a request that waits for a slot longer than queue_timeout_seconds gets 503.
+    Blocking model calls run in the threadpool so the event loop keeps serving other requests.
+    """
+
+    def __init__(self, config: ServingConfig):
+        self.solar, self.giga, self.pipeline, self.RAG = serving.load_model()
+        self.df, self.meta = serving.load_df(self.pipeline)
+        self.cache = serving.load_cache()
+        self.latencies = serving.load_latencies()
+        self.models = {"GigaChat": self.giga, "Mistral": self.solar}
+        self.hedging = HedgingConfig()
+        self.queue_timeout = config.queue_timeout_seconds
+        self.retrievals = asyncio.Semaphore(config.max_concurrent_retrievals)
+        self.generations = asyncio.Semaphore(config.max_concurrent_generations)
+
+    async def acquire(self, semaphore: asyncio.Semaphore) -> None:
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="Server is busy, try again later")
+
+    @asynccontextmanager
+    async def slot(self, semaphore: asyncio.Semaphore):
+        await self.acquire(semaphore)
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    def check_models(self, names: List[str]) -> None:
+        unknown = [name for name in names if name not in self.models]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown models {unknown}, expected {list(self.models)}")
+
+    def check_ids(self, ids: List[int]) -> None:
+        # удаленные фрагменты остаются в хранилище с пустым текстом и без страницы
+        store = self.pipeline.store
+        unknown = [i for i in ids if not 0 <= i < len(store) or store.page_ids[i] < 0]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown chunk ids {unknown}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # загрузка моделей блокирует запуск, запросы до ее окончания не принимаются
+    app.state.worker = Worker(ServingConfig())
+    yield
+
+
+app = FastAPI(title="RuStore support QA", lifespan=lifespan)
+
+
+def _worker(request: Request) -> Worker:
+    return request.app.state.worker
+
+
+def _line(event: dict) -> bytes:
+    return (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/metrics")
+async def metrics(request: Request):
+    worker = _worker(request)
+    result = {"latency_seconds": {name: {"count": len(histogram),
+                                         "p50": histogram.percentile(0.5),
+                                         "p90": histogram.percentile(0.9)}
+                                  for name, histogram in worker.latencies.items()}}
+    if hasattr(worker.solar, "metrics"):
+        result.update(worker.solar.metrics())
+    if worker.cache is not None:
+        result["cache"] = {"entries": len(worker.cache), "hits": worker.cache.hits, "misses": worker.cache.misses}
+    return result
+
+
+@app.post("/retrieve")
+async def retrieve(body: RetrieveRequest, request: Request):
+    """First stage candidates: chunk id, text, source and score."""
+    worker = _worker(request)
+    async with worker.slot(worker.retrievals):
+        results = await run_in_threadpool(worker.pipeline.query, body.query, body.k, body.fusion)
+    return [{**result, 'index': int(result['index']), 'score': float(result['score'])} for result in results]
+
+
+@app.post("/rerank")
+async def rerank_ids(body: RerankRequest, request: Request):
+    """Chunk ids ordered by the reranker, best first."""
+    worker = _worker(request)
+    worker.check_ids(body.ids)
+    candidates = [{'index': i, 'content': worker.df[i]} for i in body.ids]
+    async with worker.slot(worker.retrievals):
+        ids = await run_in_threadpool(rerank, body.query, candidates, worker.RAG, body.k)
+    return {"ids": [int(i) for i in ids if i is not None]}
+
+
+@app.post("/documents")
+async def documents(body: DocumentsRequest, request: Request):
+    """Prompt and the passages packed into it, without generation."""
+    worker = _worker(request)
+    async with worker.slot(worker.retrievals):
+        prompt, docs = await run_in_threadpool(get_documents, body.query, worker.pipeline, worker.RAG,
+                                               worker.df, worker.meta)
+    return {"prompt": prompt, "docs": docs}
+
+
+@app.post("/answer")
+async def answer(body: AnswerRequest, request: Request):
+    worker = _worker(request)
+    worker.check_models([body.model])
+    async with worker.slot(worker.generations):
+        result, docs = await run_in_threadpool(serving.process_query, body.query, worker.pipeline, worker.RAG,
+                                               worker.models[body.model], worker.df, worker.meta, worker.cache)
+    return {"model": body.model, "answer": result, "docs": docs}
+
+
+@app.post("/chat")
+async def chat(body: ChatRequest, request: Request):
+    """
+    Streams newline-delimited JSON: one {"event": "docs"} with the passages, then {"event": "answer", "model",
+    "delta", "done"} as the models generate. hedged=true returns only the fastest acceptable answer.
+    If no generation slot frees up within the queue timeout, the stream is a single {"event": "error"}.
+    """
+    worker = _worker(request)
+    worker.check_models(body.models)
+    models = {name: worker.models[name] for name in body.models}
+
+    async def events():
+        # слот берется внутри потока: если клиент ушел до его начала, генератор не запускается и слот не теряется
+        try:
+            await worker.acquire(worker.generations)
+        except HTTPException as e:
+            yield _line({"event": "error", "status": e.status_code, "detail": e.detail})
+            return
+        cancelled = threading.Event()
+        try:
+            if body.hedged:
+                name, text, docs = await run_in_threadpool(serving.process_query_hedged, body.query, worker.models,
+                                                           worker.pipeline, worker.RAG, worker.df, worker.meta,
+                                                           worker.latencies, worker.hedging, worker.cache)
+                yield _line({"event": "docs", "docs": docs})
+                yield _line({"event": "answer", "model": name, "delta": text, "done": True})
+                return
+
+            sent, docs_sent = {}, False
+            stream = serving.process_query_concurrent(body.query, models, worker.pipeline, worker.RAG, worker.df,
+                                                      worker.meta, worker.cache, worker.latencies, cancelled)
+            while True:
+                event = await run_in_threadpool(next, stream, None)
+                if event is None:
+                    break
+                name, text, docs, done = event
+                if not docs_sent:
+                    docs_sent = True
+                    yield _line({"event": "docs", "docs": docs})
+                if name is None:
+                    continue
+                delta, sent[name] = text[len(sent.get(name, '')):], text
+                yield _line({"event": "answer", "model": name, "delta": delta, "done": done})
+        finally:
+            # при обрыве соединения генерации отменяются в vLLM и GigaChat; закрыть сам генератор отсюда нельзя,
+            # пока его next выполняется в пуле потоков, поэтому отмена передается событием
+            cancelled.set()
+            worker.generations.release()
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # один процесс на набор GPU: модели загружаются в каждом воркере uvicorn заново
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,43 +1,36 @@
-import utils.generatives
-import os
-from utils.get_prompt import get_documents
-from utils.config import GenerationConfig
-from utils.ranking import MyExistingRetrievalPipeline
-from ragatouille import RAGPretrainedModel
+import logging
+import itertools
+from utils.config import HedgingConfig, ServingConfig
+from utils.api_client import ApiClient
 import streamlit as st
-import joblib
+
+logger = logging.getLogger(__name__)
+
+# модели загружаются один раз на процесс и общие для всех сессий; utils.serving импортируется только без api_url,
+# чтобы тонкому клиенту не нужны были torch, vllm и индексы
+
 
 @st.cache_resource
 def load_model():
-    utils.generatives.get_os()
-    model_path = 'mistralai/Mistral-7B-Instruct-v0.2'
-    solar = utils.generatives.Mistral("mistral", model_path)
-    giga = utils.generatives.GigaApi("gigachat")
-    
-    pipeline = MyExistingRetrievalPipeline()
-    pipeline.load_index('./indexes/indexes_cp.index', 
-                        './indexes/collection_cp.pkl', 
-                        './indexes/bm_cp.pkl')
+    from utils import serving
+    return serving.load_model()
 
-    RAG = RAGPretrainedModel.from_pretrained("antoinelouis/colbert-xm")
-    
-    return solar, giga, pipeline, RAG
+
+@st.cache_resource
+def load_cache():
+    from utils import serving
+    return serving.load_cache()
 
 
 @st.cache_resource
-def load_df():
-    df = joblib.load('./indexes/content_new.pkl')
-    meta = joblib.load('./indexes/meta.pkl')
-    return df, meta
+def load_latencies():
+    from utils import serving
+    return serving.load_latencies()
 
-def process_query(query, pipeline, RAG, model, df, meta):
-    prompt, context1, meta1, context2, meta2, context3, meta3 = get_documents(query, pipeline, RAG, df, meta)
-    model.config_prompt(system_prompt=GenerationConfig.system_prompt)
-    try:
-        answer = model.inference(prompt, max_new_tokens=1000)
-    except:
-        answer = model.inference(prompt)
-    return answer, context1, meta1, context2, meta2, context3, meta3
+
+@st.cache_resource
+def load_client(api_url):
+    return ApiClient(api_url)
 
 
 def display_collapsible_docs(docs, doc_type):
@@ -68,8 +61,32 @@ def main():
 #     st.set_page_config(page_title="Поддержка RuStore", page_icon=image_path_logo)
     st.title("Поддержка RuStore")
 
-    solar, giga, pipeline, RAG = load_model()
-    df, meta = load_df()
+    hedging = HedgingConfig()
+    avatars = {"GigaChat": image_path, "Mistral": image_path_mis}
+    api_url = ServingConfig().api_url
+    if api_url:
+        # тонкий клиент: поиск и генерация выполняются сервисом api.py
+        client = load_client(api_url)
+        stream_answers = lambda query: client.stream_answers(query, list(avatars))
+        hedged_answer = client.answer_hedged
+        metrics = client.metrics
+    else:
+        from utils import serving
+        from utils.serving import process_query_concurrent, process_query_hedged
+
+        solar, giga, pipeline, RAG = load_model()
+        df, meta = serving.load_df(pipeline)
+        cache = load_cache()
+        latencies = load_latencies()
+        models = {"GigaChat": giga, "Mistral": solar}
+        stream_answers = lambda query: process_query_concurrent(query, models, pipeline, RAG, df, meta, cache,
+                                                                latencies)
+        hedged_answer = lambda query: process_query_hedged(query, models, pipeline, RAG, df, meta, latencies,
+                                                           hedging, cache)
+        metrics = solar.metrics if hasattr(solar, "metrics") else None
+    if metrics is not None:
+        with st.sidebar.expander("Очередь генерации Mistral"):
+            st.json(metrics())
 
     if "messages" not in st.session_state:
         st.session_state.messages = []
@@ -83,19 +100,31 @@ def main():
         with st.chat_message("user"):
             st.markdown(prompt)
 
-        with st.spinner("Получение ответа GigaChat Pro"):
-            answer, context1, meta1, context2, meta2, context3, meta3 = process_query(prompt, pipeline, RAG, giga, df, meta)
-            st.session_state.messages.append({"role": "assistant", "content": answer})
-
-            docs = [{"metadata": meta1, "page_content": context1}, {"metadata": meta2, "page_content": context2}, {"metadata": meta3, "page_content": context3}]
+        if hedging.enabled:
+            with st.spinner("Получение ответа"):
+                name, answer, docs = hedged_answer(prompt)
             display_collapsible_docs(docs, "Документ")
-            display_chat_message(f"#### Ответ GigaChat \n{answer}", "assistant", avatar=image_path)
-            
-        with st.spinner("Получение ответа Mistral"):
-            answer, context1, meta1, context2, meta2, context3, meta3 = process_query(prompt, pipeline, RAG, solar, df, meta)
+            display_chat_message(f"#### Ответ {name} \n{answer}", "assistant", avatar=avatars[name])
             st.session_state.messages.append({"role": "assistant", "content": answer})
-
-            display_chat_message(f"#### Ответ Mistral \n{answer}", "assistant", avatar=image_path_mis)
+            return
+
+        placeholders = {}
+        # поиск документов выполняется один раз, документы показываются сразу после него,
+        # ответы моделей выводятся по мере генерации токенов
+        with st.spinner("Поиск документов"):
+            stream = stream_answers(prompt)
+            first = next(stream)
+        display_collapsible_docs(first[2], "Документ")
+
+        for name in avatars:
+            placeholders[name] = st.chat_message("assistant", avatar=avatars[name]).empty()
+        for name, answer, _, done in itertools.chain([first], stream):
+            if name is None:
+                # событие готовности документов, ответа в нем нет
+                continue
+            placeholders[name].markdown(f"#### Ответ {name} \n{answer}" + ("" if done else " ▌"))
+            if done:
+                st.session_state.messages.append({"role": "assistant", "content": answer})
 
 if __name__ == "__main__":
     main()
@@ -1,7 +1,10 @@
+import logging
 import streamlit as st
 import main
 import update_documents
 
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
 image_path_logo = './icons/rustore-icon.svg'
 st.set_page_config(page_title="Поддержка RuStore", page_icon=image_path_logo)
 st.sidebar.title("Страницы")
@@ -0,0 +1,55 @@
+import logging
+
+import numpy as np
+
+from utils import answer_cache
+from utils.answer_cache import SemanticAnswerCache
+
+
+def vector(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def test_hit_above_threshold_for_the_same_model():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.put(vector(1, 0, 0), "gigachat", "ответ", query="как оплатить")
+    assert cache.get(vector(10, 0.1, 0), "gigachat") == "ответ"
+    assert cache.get(vector(10, 0.1, 0), "mistral") is None
+    assert cache.get(vector(1, 1, 0), "gigachat") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_shadow_mode_logs_but_never_serves(caplog):
+    cache = SemanticAnswerCache(threshold=0.5, serve=False, log_top=2)
+    cache.put(vector(1, 0), "gigachat", "ответ", query="как оплатить")
+    with caplog.at_level(logging.INFO, logger=answer_cache.__name__):
+        assert cache.get(vector(1, 0), "gigachat", query="как заплатить") is None
+    assert "1.0000 'как оплатить'" in caplog.text
+
+
+def test_ttl_and_lru_eviction(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache = SemanticAnswerCache(ttl_seconds=10, max_entries=2)
+    cache.put(vector(1, 0, 0), "m", "a")
+    cache.put(vector(0, 1, 0), "m", "b")
+    assert cache.get(vector(1, 0, 0), "m") == "a"  # "a" становится самым свежим
+    cache.put(vector(0, 0, 1), "m", "c")
+    assert len(cache) == 2
+    assert cache.get(vector(0, 1, 0), "m") is None
+    now[0] += 11
+    assert cache.get(vector(1, 0, 0), "m") is None
+    assert len(cache) == 0
+
+
+def test_new_index_version_clears_entries(tmp_path):
+    version_path = tmp_path / "version.txt"
+    version_path.write_text("v1")
+    cache = SemanticAnswerCache(version_path=str(version_path))
+    cache.put(vector(1, 0), "m", "a")
+    assert cache.get(vector(1, 0), "m") == "a"
+    version_path.write_text("v2")
+    # mtime может не измениться за время теста, версия перечитывается по его изменению
+    cache._version_mtime = None
+    assert cache.get(vector(1, 0), "m") is None
+    assert len(cache) == 0
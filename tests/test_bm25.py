@@ -0,0 +1,48 @@
+import numpy as np
+
+from utils.bm25 import BM25Index, tokenize
+
+DOCS = [
+    "Как подключить платежи в приложении",
+    "Платежи и подписки: платежи проходят через RuStore, платежи возвращаются",
+    "Загрузка APK в консоль разработчика",
+    "",
+    "Ёлка и елка - одно слово",
+]
+
+
+def test_tokenize_folds_stems_and_drops_stopwords():
+    assert tokenize("Ёлка и ЕЛКИ") == tokenize("елка елки")
+    assert "и" not in tokenize("платежи и подписки")
+    assert tokenize("платежи") == tokenize("платежей")
+    assert tokenize("Payments for apps 2024") == ["payment", "app", "2024"]
+
+
+def test_ranks_by_term_frequency_and_skips_unmatched_docs():
+    index = BM25Index.build(DOCS)
+    ids, scores = index.get_top_k("платежи", k=10)
+    assert ids.tolist() == [1, 0]
+    assert scores[0] > scores[1] > 0
+    assert index.get_top_k("елки", k=10)[0].tolist() == [4]
+
+
+def test_top_k_and_empty_queries():
+    index = BM25Index.build(DOCS)
+    ids, scores = index.get_top_k("платежи консоль", k=1)
+    assert len(ids) == len(scores) == 1
+    assert len(index.get_top_k("и в на", k=5)[0]) == 0
+    assert len(index.get_top_k("платежи", k=0)[0]) == 0
+    assert index.num_docs == len(DOCS)
+
+
+def test_save_load_round_trip(tmp_path):
+    index = BM25Index.build(DOCS, k1=1.2, b=0.5)
+    index.save(str(tmp_path / "bm25"))
+    loaded = BM25Index.load(str(tmp_path / "bm25"))
+    assert isinstance(loaded.doc_ids, np.memmap)
+    assert (loaded.k1, loaded.b, loaded.num_docs) == (1.2, 0.5, len(DOCS))
+    for query in ("платежи", "консоль разработчика", "елка платежи"):
+        expected_ids, expected_scores = index.get_top_k(query, k=3)
+        ids, scores = loaded.get_top_k(query, k=3)
+        assert ids.tolist() == expected_ids.tolist()
+        np.testing.assert_allclose(scores, expected_scores)
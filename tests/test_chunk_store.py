@@ -0,0 +1,39 @@
+import numpy as np
+
+from utils.chunk_store import ChunkStore, format_doc_id
+
+TEXTS = ["Первый фрагмент", "", "second chunk ✓", "Третий"]
+METAS = [{"current_url": "https://a/1", "h1_text": "A"}, {}, {"current_url": "https://a/2"},
+         {"h1_text": "A", "current_url": "https://a/1"}]
+
+
+def test_offsets_address_every_text():
+    store = ChunkStore.build(TEXTS, METAS)
+    assert len(store) == 4
+    assert store.offsets.tolist() == np.cumsum([0] + [len(t.encode('utf-8')) for t in TEXTS]).tolist()
+    assert [store.text(i) for i in range(4)] == TEXTS
+
+
+def test_pages_are_stored_once():
+    store = ChunkStore.build(TEXTS, METAS)
+    assert len(store.pages) == 2
+    assert store.page_ids.tolist() == [0, -1, 1, 0]
+    assert store.meta(1) == {}
+    assert store.meta(3) == METAS[0]
+    assert store.doc_id(2) == format_doc_id(METAS[2])
+
+
+def test_save_load_round_trip(tmp_path):
+    ChunkStore.build(TEXTS, METAS).save(str(tmp_path / "chunks"))
+    store = ChunkStore.load(str(tmp_path / "chunks"))
+    assert isinstance(store.blob, np.memmap)
+    assert list(store.texts) == TEXTS
+    assert list(store.metas) == [METAS[0], {}, METAS[2], METAS[0]]
+    assert store.texts[1:3] == TEXTS[1:3]
+    assert store.texts[-1] == TEXTS[-1]
+
+
+def test_empty_store_round_trip(tmp_path):
+    ChunkStore.build(["", ""], [{}, {}]).save(str(tmp_path / "chunks"))
+    store = ChunkStore.load(str(tmp_path / "chunks"))
+    assert list(store.texts) == ["", ""] and store.pages == []
@@ -0,0 +1,58 @@
+from utils.config import ContextConfig
+from utils.context_packer import format_passage, overlap, pack_context
+
+
+def count_words(text):
+    return len(text.split())
+
+
+PAGE = {"current_url": "https://a/1", "h1_text": "Платежи"}
+OTHER = {"current_url": "https://a/2", "h1_text": "Загрузка"}
+TEXTS = [
+    "Платежи Подключите SDK платежей. Укажите ключ консоли в настройках сборки.",
+    "Платежи Укажите ключ консоли в настройках сборки. Затем вызовите метод init.",
+    "Загрузка Загрузите APK в консоль. Укажите ключ консоли в настройках сборки.",
+    "Платежи Совсем другой раздел страницы.",
+]
+METAS = [PAGE, PAGE, OTHER, PAGE]
+
+
+def config(**kwargs):
+    return ContextConfig(**{"min_overlap_chars": 20, "min_span_chars": 20, **kwargs})
+
+
+def test_overlap():
+    assert overlap("abc hello world", "hello world and more", 5) == len("hello world")
+    assert overlap("abc", "abc", 5) == 0
+    assert overlap("some text here", "unrelated text", 5) == 0
+
+
+def test_overlapping_chunks_of_a_page_are_merged():
+    passages = pack_context([0, 1], TEXTS, METAS, count_words, config())
+    assert len(passages) == 1
+    assert passages[0]["ids"] == [0, 1]
+    text = passages[0]["page_content"]
+    assert text.count("Укажите ключ консоли") == 1
+    assert text.endswith("Затем вызовите метод init.")
+
+
+def test_seen_sentences_are_dropped_from_other_pages():
+    passages = pack_context([0, 2], TEXTS, METAS, count_words, config())
+    assert [p["ids"] for p in passages] == [[0], [2]]
+    assert "Укажите ключ" not in passages[1]["page_content"]
+
+
+def test_budget_and_passage_limit():
+    passages = pack_context([0, 2, 3], TEXTS, METAS, count_words, config(max_context_tokens=25))
+    assert sum(count_words(format_passage(p["page_content"], p["metadata"])) for p in passages) <= 25
+    assert pack_context([3, 2, 0], TEXTS, METAS, count_words, config(max_passages=1))[0]["ids"] == [3]
+
+
+def test_first_passage_is_truncated_to_the_budget():
+    long_text = "Платежи " + "слово " * 200
+    passages = pack_context([0], [long_text], [PAGE], count_words, config(max_context_tokens=50))
+    assert 0 < count_words(format_passage(passages[0]["page_content"], PAGE)) <= 50
+
+
+def test_skips_missing_and_deleted_chunks():
+    assert pack_context([None, 1], ["", TEXTS[1]], [{}, PAGE], count_words, config())[0]["ids"] == [1]
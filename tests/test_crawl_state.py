@@ -0,0 +1,45 @@
+from update_docs.crawl_state import CrawlState
+
+
+def test_resume_returns_pending_and_retryable_urls(tmp_path):
+    path = str(tmp_path / "state.sqlite")
+    state = CrawlState(path)
+    assert state.begin() == (False, set(), [])
+    for url in ("a", "b", "c", "d", "e"):
+        state.add(url)
+    state.done("a")
+    state.failed("b", "503", backoff_seconds=0)
+    for _ in range(4):
+        state.failed("c", "503", backoff_seconds=0)
+    state.failed("d", "404", backoff_seconds=0, permanent=True)
+    state.checkpoint()
+    # незафиксированные изменения теряются вместе с процессом
+    state.done("e")
+    state.connection.close()
+
+    state = CrawlState(path)
+    resumed, known, todo = state.begin(max_attempts=4)
+    assert resumed and known == {"a", "b", "c", "d", "e"}
+    assert sorted(url for url, _ in todo) == ["b", "e"]
+    assert state.failures() == {"b": (1, "503"), "c": (4, "503"), "d": (1, "404")}
+    state.finish()
+    assert state.begin() == (False, set(), [])
+    state.close()
+
+
+def test_failed_backoff_doubles(tmp_path):
+    state = CrawlState(str(tmp_path / "state.sqlite"))
+    state.begin()
+    state.add("a")
+    assert [state.failed("a", "timeout", backoff_seconds=2.0) for _ in range(3)] == [(1, 2.0), (2, 4.0), (3, 8.0)]
+    state.close()
+
+
+def test_pages_manifest_round_trip(tmp_path):
+    path = str(tmp_path / "state.sqlite")
+    state = CrawlState(path)
+    state.put_page("a", {"etag": "x", "file": "a.json"})
+    state.put_page("b", {"etag": None})
+    state.remove_page("b")
+    state.close()
+    assert CrawlState(path).load_pages() == {"a": {"etag": "x", "file": "a.json"}}
@@ -0,0 +1,41 @@
+import asyncio
+
+from aiohttp import web
+
+from update_docs.crawler import crawl, normalize_url
+from update_docs.test_site import make_site, make_app
+
+
+def run_crawl(tmp_path, path, **kwargs):
+    async def run():
+        runner = web.AppRunner(make_app(str(tmp_path / "site"), **kwargs))
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}{path}"
+        try:
+            return await crawl(url, output_directory=str(tmp_path / "out"), rate_per_host=0, parse_processes=0,
+                               retry_backoff_seconds=0.01, max_attempts=8)
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(run())
+
+
+def test_normalize_url():
+    assert normalize_url("HTTPS://Www.RuStore.ru/help/users/#anchor") == "https://www.rustore.ru/help/users"
+
+
+def test_not_found_is_not_retried(tmp_path):
+    make_site(str(tmp_path / "site"), pages=3)
+    stats = run_crawl(tmp_path, "/help/missing")
+    assert stats["requests"] == 1
+    assert stats["retries"] == 0 and stats["errors"] == 1
+    assert len(stats["failed_urls"]) == 1
+
+
+def test_server_errors_are_retried(tmp_path):
+    make_site(str(tmp_path / "site"), pages=30)
+    stats = run_crawl(tmp_path, "/help", failure_rate=0.2)
+    assert stats["retries"] > 0
+    assert stats["pages"] == 30 and stats["failed_urls"] == []
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from utils.dense import NumpyIndex, RescoringIndex, create_index, load_index
+
+
+@pytest.fixture(scope="module")
+def vectors():
+    return np.random.default_rng(0).standard_normal((50, 16)).astype(np.float32)
+
+
+def exact_top(vectors, query, k):
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.argsort(-(normed @ (query / np.linalg.norm(query))))[:k].tolist()
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16", "int8"])
+def test_numpy_index_matches_exact_search(vectors, dtype):
+    index = create_index("numpy", 16, storage_dtype=dtype)
+    index.add_items(vectors, ids=list(range(100, 150)))
+    ids, distances = index.query(vectors[:3], k=5)
+    assert ids.shape == (3, 5)
+    assert [row[0] for row in ids.tolist()] == [100, 101, 102]
+    assert np.all(np.diff(distances, axis=1) >= 0)
+    if dtype == "float32":
+        assert (ids[0] - 100).tolist() == exact_top(vectors, vectors[0], 5)
+
+
+def test_numpy_index_deleted_and_k_clamp(vectors, tmp_path):
+    index = NumpyIndex(16)
+    index.add_items(vectors[:5])
+    index.mark_deleted(0)
+    assert len(index) == 4
+    ids, _ = index.query(vectors[0], k=10)
+    assert sorted(ids.tolist()) == [1, 2, 3, 4]
+    with pytest.raises(KeyError):
+        index.mark_deleted(99)
+
+    index.save(str(tmp_path / "index"))
+    loaded = load_index(str(tmp_path / "index"))
+    assert isinstance(loaded, NumpyIndex) and len(loaded) == 4
+    loaded.mark_deleted(1)
+    assert sorted(loaded.query(vectors[0], k=10)[0].tolist()) == [2, 3, 4]
+
+
+@pytest.mark.parametrize("backend, dtype", [("voyager", "e4m3"), ("numpy", "int8")])
+def test_rescoring_clamps_k_to_live_items(vectors, backend, dtype, tmp_path):
+    index = create_index(backend, 16, storage_dtype=dtype, rescore_oversample=4)
+    assert isinstance(index, RescoringIndex)
+    index.add_items(vectors[:10])
+    for i in range(6):
+        index.mark_deleted(i)
+    assert len(index) == 4
+    ids, _ = index.query(vectors[8], k=20)
+    assert ids[0] == 8 and sorted(ids.tolist()) == [6, 7, 8, 9]
+
+    path = str(tmp_path / ("index" if backend == "numpy" else "index.voy"))
+    index.save(path)
+    loaded = load_index(path, rescore_oversample=4)
+    assert isinstance(loaded, RescoringIndex) and len(loaded) == 4
+    loaded.mark_deleted(9)
+    assert sorted(loaded.query(vectors[8], k=20)[0].tolist()) == [6, 7, 8]
+    # без rescore_oversample обертка не создается
+    assert not isinstance(load_index(path), RescoringIndex)
+
+
+def test_rescoring_recovers_exact_order(vectors):
+    index = create_index("numpy", 16, storage_dtype="int8", rescore_oversample=4)
+    index.add_items(vectors)
+    ids, _ = index.query(vectors[7], k=5)
+    assert ids.tolist() == exact_top(vectors, vectors[7], 5)
@@ -0,0 +1,93 @@
+import time
+import threading
+
+import pytest
+
+from utils.config import HedgingConfig
+from utils.hedging import LatencyHistogram, hedge_delay, hedged_generate
+
+
+class FakeStream:
+    """Yields deltas every `delay` seconds until cancelled, like the vLLM and GigaChat streams."""
+
+    def __init__(self, deltas, delay=0.0, error=None):
+        self.deltas = list(deltas)
+        self.delay = delay
+        self.error = error
+        self.cancelled = threading.Event()
+        self.closed = False
+
+    def __iter__(self):
+        for delta in self.deltas:
+            if self.cancelled.wait(self.delay):
+                return
+            yield delta
+        if self.error:
+            raise self.error
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def close(self):
+        self.closed = True
+
+
+def config(**kwargs):
+    return HedgingConfig(**{"min_samples": 1, "default_delay_seconds": 0.1, "min_delay_seconds": 0.1, **kwargs})
+
+
+def test_histogram_percentile_and_window():
+    histogram = LatencyHistogram(window=4)
+    assert histogram.percentile(0.9) is None
+    for seconds in (5, 1, 2, 3, 4):
+        histogram.record(seconds)
+    assert len(histogram) == 4
+    assert histogram.percentile(0.5) == 3
+    assert histogram.percentile(1.0) == 4
+
+
+def test_hedge_delay():
+    histogram = LatencyHistogram()
+    assert hedge_delay(histogram, config(min_samples=2, default_delay_seconds=8)) == 8
+    for seconds in (0.05, 3.0):
+        histogram.record(seconds)
+    assert hedge_delay(histogram, config(min_samples=2, percentile=0.0, min_delay_seconds=1)) == 1
+    assert hedge_delay(histogram, config(min_samples=2, percentile=0.9)) == 3.0
+
+
+def run(primary, secondary, **kwargs):
+    histograms = {"a": LatencyHistogram(), "b": LatencyHistogram()}
+    result = hedged_generate("a", "b", {"a": lambda: primary, "b": lambda: secondary}, histograms, config(**kwargs))
+    return result, histograms
+
+
+def test_fast_primary_is_not_hedged():
+    secondary = FakeStream(["x"])
+    (name, answer, hedged), histograms = run(FakeStream(["при", "вет"]), secondary)
+    assert (name, answer, hedged) == ("a", "привет", False)
+    assert len(histograms["a"]) == 1 and len(histograms["b"]) == 0
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    primary = FakeStream(["медленно"] * 100, delay=0.05)
+    started = time.perf_counter()
+    (name, answer, hedged), histograms = run(primary, FakeStream(["быстро"]))
+    assert (name, answer, hedged) == ("b", "быстро", True)
+    assert time.perf_counter() - started < 1
+    assert primary.cancelled.wait(1)
+    # отмененный основной бэкенд записывается цензурированным замером
+    deadline = time.time() + 1
+    while not len(histograms["a"]) and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(histograms["a"]) == 1 and primary.closed
+
+
+def test_failed_primary_hedges_at_once():
+    (name, answer, hedged), _ = run(FakeStream([], error=ValueError("boom")), FakeStream(["ok"]),
+                                    default_delay_seconds=10, min_samples=100)
+    assert (name, answer, hedged) == ("b", "ok", True)
+
+
+def test_both_failed():
+    with pytest.raises(RuntimeError):
+        run(FakeStream([], error=ValueError("a")), FakeStream([], error=ValueError("b")))
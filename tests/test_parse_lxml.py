@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+from update_docs import parse_lxml
+from update_docs.parse_lxml import EDGE_CASES, check_parity
+from update_docs.test_site import make_site, page_path
+
+BASE_URL = 'https://www.rustore.ru/help'
+
+
+@pytest.fixture(scope="module")
+def site_pages(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("site")
+    pages = []
+    for n in range(make_site(str(directory), pages=50)):
+        with open(os.path.join(directory, page_path(n) if n else 'help', 'index.html'), encoding='utf-8') as f:
+            pages.append((f"https://www.rustore.ru/{page_path(n)}/", f.read()))
+    return pages
+
+
+def test_synthetic_site_matches_beautifulsoup(site_pages):
+    assert check_parity(site_pages, BASE_URL) == []
+
+
+def test_edge_cases_match_beautifulsoup():
+    assert check_parity([(BASE_URL + '/users/edge-cases/', EDGE_CASES)], BASE_URL) == []
+
+
+def test_check_parity_reports_differences(monkeypatch):
+    # проверка не пустая: расхождение lxml-версии с parse_html попадает в результат
+    monkeypatch.setattr(parse_lxml, 'parse_content', lambda tree, base_url: [])
+    mismatches = check_parity([(BASE_URL + '/users/edge-cases/', EDGE_CASES)], BASE_URL)
+    assert [url for url, _, _ in mismatches] == [BASE_URL + '/users/edge-cases/']
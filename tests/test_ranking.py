@@ -0,0 +1,80 @@
+import threading
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+from utils.bm25 import BM25Index
+from utils.chunk_store import ChunkStore
+from utils.config import RetrievalConfig
+from utils.dense import NumpyIndex
+from utils.ranking import MyExistingRetrievalPipeline, reciprocal_rank_fusion, weighted_fusion
+
+
+def test_rrf_prefers_ids_ranked_by_both_lists():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1, 4]], rrf_k=60)
+    assert [idx for idx, _ in fused] == [1, 3, 2, 4]
+    assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+    assert fused[-1][1] == pytest.approx(1 / 63)
+
+
+def test_weighted_fusion_normalizes_each_leg():
+    # скоры ног в разных шкалах: косинус и BM25
+    fused = weighted_fusion(([1, 2, 3], [0.9, 0.8, 0.7]), ([3, 4], [12.0, 2.0]), dense_weight=0.7)
+    assert [idx for idx, _ in fused] == [1, 2, 3, 4]
+    assert dict(fused)[1] == pytest.approx(0.7)
+    assert dict(fused)[3] == pytest.approx(0.3)
+    lexical_first = weighted_fusion(([1, 2, 3], [0.9, 0.8, 0.7]), ([3, 4], [12.0, 2.0]), dense_weight=0.2)
+    assert lexical_first[0][0] == 3
+
+
+def test_weighted_fusion_with_flat_or_empty_leg():
+    assert weighted_fusion(([5, 6], [0.5, 0.5]), ([], []), dense_weight=0.5) == [(5, 0.5), (6, 0.5)]
+
+
+def make_pipeline(fusion):
+    texts = ["платежи в приложении", "загрузка apk", "подписки, скидки, акции и платежи", "отзывы"]
+    pipeline = MyExistingRetrievalPipeline.__new__(MyExistingRetrievalPipeline)
+    pipeline.config = RetrievalConfig(fusion=fusion)
+    pipeline.store = ChunkStore.build(texts, [{"current_url": f"u{i}"} for i in range(len(texts))])
+    pipeline._bm25 = BM25Index.build(texts)
+    pipeline._bm25_loader = None
+    pipeline._bm25_lock = threading.Lock()
+    return pipeline
+
+
+@pytest.mark.parametrize("fusion, expected", [
+    ("dense", [1, 0]),
+    ("rrf", [0, 1, 2]),
+    # dense 1 -> 0.7, bm25 0 -> 0.3, 2 - самый длинный документ, после нормировки 0
+    ("weighted", [1, 0, 2]),
+])
+def test_fuse_orders_by_mode(fusion, expected):
+    pipeline = make_pipeline(fusion)
+    docs = pipeline._fuse("платежи", [1, 0], [0.9, 0.85], k=2, fusion=fusion)
+    assert [doc["index"] for doc in docs] == expected
+    assert docs[0]["content"] == pipeline.store.text(expected[0])
+    assert [doc["score"] for doc in docs] == sorted((doc["score"] for doc in docs), reverse=True)
+
+
+def test_unknown_fusion_mode():
+    with pytest.raises(ValueError):
+        make_pipeline("dense")._fuse("платежи", [1], [0.9], k=1, fusion="bm25")
+
+
+def test_bm25_is_loaded_on_first_lexical_query(tmp_path):
+    source = make_pipeline("rrf")
+    index = NumpyIndex(4)
+    index.add_items(np.eye(4, dtype=np.float32))
+    index.save(str(tmp_path / "index"))
+    source.store.save(str(tmp_path / "chunks"))
+    source.bm25.save(str(tmp_path / "bm25"))
+
+    pipeline = make_pipeline("dense")
+    pipeline.load_index(str(tmp_path / "index"), str(tmp_path / "chunks"), str(tmp_path / "bm25"))
+    pipeline._fuse("платежи", [1, 0], [0.9, 0.85], k=2, fusion="dense")
+    assert pipeline._bm25 is None
+    docs = pipeline._fuse("платежи", [1, 0], [0.9, 0.85], k=2, fusion="rrf")
+    assert isinstance(pipeline._bm25.doc_ids, np.memmap)
+    assert [doc["index"] for doc in docs] == [0, 1, 2]
@@ -0,0 +1,67 @@
+import os
+import asyncio
+
+from aiohttp import web
+
+from update_docs.crawler import crawl
+from update_docs.snapshots import SnapshotArchive
+from update_docs.test_site import make_site, make_app, touch_pages
+
+
+def test_put_get_and_records(tmp_path):
+    with SnapshotArchive(str(tmp_path)) as archive:
+        archive.put('https://a/x', 'привет'.encode('cp1251'), encoding='cp1251', base_url='https://a',
+                    page_url='https://a/x/')
+        archive.put('https://a/y', b'<p>y</p>')
+        assert archive.get('https://a/x') == 'привет'
+        assert archive.get('https://a/z') is None
+        assert 'https://a/y' in archive and len(archive) == 2
+        assert [(url, page_url) for url, page_url, *_ in archive.records()] == [
+            ('https://a/x', 'https://a/x/'), ('https://a/y', 'https://a/y')]
+
+
+def test_compact_drops_superseded_records(tmp_path):
+    with SnapshotArchive(str(tmp_path)) as archive:
+        for version in range(5):
+            archive.put('https://a/x', f'<p>{version}</p>'.encode() * 100)
+        archive.put('https://a/y', b'<p>y</p>')
+        archive.remove('https://a/y')
+        size = os.path.getsize(archive.path)
+        assert archive.superseded_fraction() > 0.5
+
+        archive.compact()
+        assert os.path.getsize(archive.path) < size / 4
+        assert archive.superseded_fraction() == 0
+        assert archive.get('https://a/x') == '<p>4</p>' * 100
+        # после сжатия новые записи дописываются в тот же файл
+        archive.put('https://a/z', b'<p>z</p>')
+    with SnapshotArchive(str(tmp_path)) as archive:
+        assert archive.get('https://a/x') == '<p>4</p>' * 100
+        assert archive.get('https://a/z') == '<p>z</p>'
+
+
+def test_crawl_compacts_archive(tmp_path):
+    async def run():
+        make_site(str(tmp_path / "site"), pages=10)
+        runner = web.AppRunner(make_app(str(tmp_path / "site")))
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/help"
+        output_directory = str(tmp_path / "out")
+        try:
+            first = await crawl(url, output_directory=output_directory, rate_per_host=0, parse_processes=0)
+            # все страницы изменились: старые записи занимают половину архива
+            touch_pages(str(tmp_path / "site"), range(10))
+            second = await crawl(url, output_directory=output_directory, rate_per_host=0, parse_processes=0,
+                                 compact_fraction=0.4)
+        finally:
+            await runner.cleanup()
+        return first, second, output_directory + ".snapshots"
+
+    first, second, snapshot_directory = asyncio.run(run())
+    assert first["pages"] == 10 and not first["snapshots_compacted"]
+    assert second["pages"] == 10 and second["snapshots_compacted"]
+    with SnapshotArchive(snapshot_directory) as archive:
+        assert archive.superseded_fraction() == 0
+        assert len(archive) == 10
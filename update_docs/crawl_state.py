@@ -0,0 +1,104 @@
+import json
+import time
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    entry TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS frontier (
+    url TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    failures INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# GONE - ошибка, которую повтор не исправит (404, 410, ошибка разбора): не повторяется и при продолжении обхода
+PENDING, DONE, FAILED, GONE = "pending", "done", "failed", "gone"
+
+
+class CrawlState:
+    """
+    Crawl state in one SQLite file: the manifest of fetched pages (ETag, Last-Modified, lastmod, content hash,
+    file) and the frontier of the current crawl with failure counts. Changes go into an open transaction
+    and become durable at checkpoint(), so a killed crawl resumes from the last checkpoint.
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    def checkpoint(self):
+        self.connection.commit()
+
+    # манифест страниц
+
+    def load_pages(self):
+        return {url: json.loads(entry) for url, entry in self.connection.execute("SELECT url, entry FROM pages")}
+
+    def put_page(self, url, entry):
+        self.connection.execute("INSERT OR REPLACE INTO pages (url, entry) VALUES (?, ?)",
+                                (url, json.dumps(entry, ensure_ascii=False)))
+
+    def remove_page(self, url):
+        self.connection.execute("DELETE FROM pages WHERE url = ?", (url,))
+
+    # граница обхода
+
+    def begin(self, resume=True, max_attempts=4):
+        """
+        Starts a crawl. If the previous one did not finish and resume is set, returns its frontier:
+        (True, every known url, [(url, delay) to fetch]) - pending urls and failed ones with retries left.
+        Otherwise clears the frontier and returns (False, set(), []).
+        """
+        running = self.connection.execute("SELECT value FROM state WHERE key = 'running'").fetchone()
+        if resume and running and running[0] == '1':
+            now = time.time()
+            known = {url for url, in self.connection.execute("SELECT url FROM frontier")}
+            todo = [(url, max(0.0, next_attempt - now)) for url, next_attempt in self.connection.execute(
+                "SELECT url, next_attempt FROM frontier WHERE status = ? OR (status = ? AND failures < ?)",
+                (PENDING, FAILED, max_attempts))]
+            return True, known, todo
+        self.connection.execute("DELETE FROM frontier")
+        self.connection.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('running', '1')")
+        self.connection.commit()
+        return False, set(), []
+
+    def add(self, url):
+        self.connection.execute("INSERT OR IGNORE INTO frontier (url, status) VALUES (?, ?)", (url, PENDING))
+
+    def done(self, url):
+        self.connection.execute("UPDATE frontier SET status = ?, error = NULL WHERE url = ?", (DONE, url))
+
+    def failed(self, url, error, backoff_seconds, permanent=False):
+        """
+        Records a failure, the next attempt is backoff_seconds * 2^(failures - 1) later; a permanent failure
+        is never retried. Returns (failure count of the url, delay before the next attempt).
+        """
+        failures = self.connection.execute("SELECT failures FROM frontier WHERE url = ?", (url,)).fetchone()[0] + 1
+        delay = backoff_seconds * 2 ** (failures - 1)
+        self.connection.execute(
+            "UPDATE frontier SET status = ?, failures = ?, next_attempt = ?, error = ? WHERE url = ?",
+            (GONE if permanent else FAILED, failures, time.time() + delay, error, url))
+        return failures, delay
+
+    def failures(self):
+        """url -> (failures, last error) of urls that are still failing."""
+        return {url: (failures, error) for url, failures, error in self.connection.execute(
+            "SELECT url, failures, error FROM frontier WHERE status IN (?, ?)", (FAILED, GONE))}
+
+    def finish(self):
+        self.connection.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('running', '0')")
+        self.connection.commit()
@@ -0,0 +1,460 @@
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import xml.etree.ElementTree as ET
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+import aiohttp
+from bs4 import BeautifulSoup
+
+from update_docs import parse_lxml
+from update_docs.crawl_state import CrawlState
+from update_docs.parse_html import get_meta_information, parse_content
+from update_docs.snapshots import SnapshotArchive, read_record
+
+logger = logging.getLogger(__name__)
+
+START_URL = 'https://www.rustore.ru/help/'
+OUTPUT_DIRECTORY = './parser/json_docs'
+
+
+def normalize_url(url):
+    """Same page, same string: no fragment, no trailing slash, lowercase scheme and host."""
+    parts = urlsplit(url.split('#')[0])
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip('/'), parts.query, ''))
+
+
+def url_to_filename(url):
+    """Stable output file name of a page: readable path slug plus a hash of the normalized URL."""
+    url = normalize_url(url)
+    slug = re.sub(r'[^0-9A-Za-z_-]+', '_', urlsplit(url).path).strip('_')[-80:] or 'index'
+    return f"{slug}_{hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]}.json"
+
+
+def parse_sitemap(xml):
+    """(urls with lastmod or None, nested sitemap urls) of a sitemap or a sitemap index."""
+    root = ET.fromstring(xml)
+    namespace = {'sm': 'http://www.sitemaps.org/schemas/sitemap/0.9'}
+    urls = {}
+    for url in root.findall('sm:url', namespace):
+        lastmod = url.findtext('sm:lastmod', default=None, namespaces=namespace)
+        urls[normalize_url(url.findtext('sm:loc', namespaces=namespace).strip())] = lastmod
+    sitemaps = [sitemap.findtext('sm:loc', namespaces=namespace).strip()
+                for sitemap in root.findall('sm:sitemap', namespace)]
+    return urls, sitemaps
+
+
+def extract_links(soup, page_url, base_url):
+    links = set()
+    for link in soup.find_all('a', href=True):
+        href = normalize_url(urljoin(page_url, link['href']))
+        if href.startswith(base_url):
+            links.add(href)
+    return links
+
+
+def extract_links_lxml(tree, page_url, base_url):
+    links = set()
+    for link in parse_lxml.find_all(tree, 'a'):
+        if link.get('href') is not None:
+            href = normalize_url(urljoin(page_url, link.get('href')))
+            if href.startswith(base_url):
+                links.add(href)
+    return links
+
+
+def parse_page(url, html, base_url, backend='bs4'):
+    """
+    (meta, content, links) of a page with the BeautifulSoup handlers or their lxml version (backend='lxml').
+    url is the address the page was served from: it goes to meta current_url and relative links resolve against it.
+    """
+    if backend == 'lxml':
+        tree = parse_lxml.parse_html(html)
+        return (parse_lxml.get_meta_information(tree, url), parse_lxml.parse_content(tree, base_url),
+                extract_links_lxml(tree, url, base_url))
+    soup = BeautifulSoup(html, 'lxml')
+    return get_meta_information(soup, url), parse_content(soup, base_url), extract_links(soup, url, base_url)
+
+
+def save_page(output_directory, url, meta_info, content_data):
+    os.makedirs(output_directory, exist_ok=True)
+    filename = os.path.join(output_directory, url_to_filename(url))
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump({"meta": meta_info, "content": content_data}, f, indent=4, ensure_ascii=False)
+    return filename
+
+
+def is_retryable(error):
+    """Connection errors, timeouts, 429 and 5xx may pass on a later attempt, other 4xx and the rest will not."""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+class HostRateLimiter:
+    """Spaces requests to the same host at least 1 / rate seconds apart (rate=0 - no limit)."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self._next = {}
+        self._lock = asyncio.Lock()
+
+    async def wait(self, url):
+        if not self.interval:
+            return
+        host = urlsplit(url).netloc
+        async with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next.get(host, now))
+            self._next[host] = start + self.interval
+        await asyncio.sleep(start - now)
+
+
+async def resolve_url(session, url):
+    """Normalized URL the page is served from after redirects; the URL itself if the request fails."""
+    try:
+        async with session.get(url) as response:
+            return normalize_url(str(response.url))
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.warning("Start page %s is not available: %s", url, e)
+        return url
+
+
+async def fetch_sitemap(session, sitemap_url, base_url):
+    """
+    (page URLs under base_url with their lastmod, complete) following sitemap indexes; complete is False if
+    any of the sitemaps could not be read, ({}, False) if there is no sitemap.
+    """
+    urls, pending, seen, complete = {}, [sitemap_url], set(), True
+    while pending:
+        url = pending.pop()
+        if url in seen:
+            continue
+        seen.add(url)
+        try:
+            async with session.get(url) as response:
+                response.raise_for_status()
+                page_urls, sitemaps = parse_sitemap(await response.read())
+        except (aiohttp.ClientError, asyncio.TimeoutError, ET.ParseError) as e:
+            logger.warning("Sitemap %s is not available: %s", url, e)
+            complete = False
+            continue
+        urls.update({page: lastmod for page, lastmod in page_urls.items() if page.startswith(base_url)})
+        pending.extend(sitemaps)
+    return urls, complete
+
+
+async def crawl(start_url=START_URL, base_url=None, output_directory=OUTPUT_DIRECTORY, concurrency=16,
+                rate_per_host=20.0, timeout=30, sitemap_url=None, state_path=None, force=False,
+                follow_links=True, resume=True, max_attempts=4, retry_backoff_seconds=2.0,
+                checkpoint_seconds=10.0, snapshot_directory=None, parse_processes=None, parser_backend='bs4',
+                compact_fraction=0.5):
+    """
+    Crawl of the documentation: a queue of URLs served by `concurrency` workers over one pooled aiohttp
+    session, at most rate_per_host requests per second to a host. Fetched pages go through a queue to the
+    parse stage: parse_content (parser_backend='bs4') or its lxml version ('lxml') in a pool of
+    parse_processes processes (all cores by default, 0 - in the event loop). Every page is saved as JSON
+    in the same format as parsser.scrape_site, in a file named by its URL.
+
+    Refresh is incremental through the manifest in the state database (<output_directory>.crawl.sqlite by
+    default): pages whose sitemap lastmod has not changed are not requested, the rest (all known pages if
+    there is no sitemap) are requested with If-None-Match / If-Modified-Since, and only pages whose HTML
+    actually changed are parsed again. Pages that left the sitemap lose their files, unless some sitemap
+    could not be read. force=True recrawls everything. Without base_url the start page is requested first
+    and base_url is taken from the URL it redirects to, so that the sitemap entries of the canonical host match.
+
+    The frontier and failure counts are checkpointed every checkpoint_seconds: a crawl that was killed is
+    resumed from its last checkpoint by the next call (resume=False starts over). A URL that failed with
+    a connection error, a timeout, 429 or 5xx is retried after retry_backoff_seconds, doubling each time, up to
+    max_attempts attempts; other 4xx responses fail at once.
+
+    Raw HTML of every fetched page is kept in a SnapshotArchive (<output_directory>.snapshots by default),
+    so reparse_snapshots can apply a changed parser without fetching the site again. A changed page appends
+    a new record; when superseded records take more than compact_fraction of the archive, it is compacted
+    at the end of the crawl. Returns crawl statistics.
+    """
+    start_url = normalize_url(start_url)
+    # база лежит рядом с папкой страниц, чтобы parse_json не принял ее за страницу
+    state_path = state_path or output_directory.rstrip('/\\') + '.crawl.sqlite'
+    os.makedirs(os.path.dirname(state_path) or '.', exist_ok=True)
+    state = CrawlState(state_path)
+    archive = SnapshotArchive(snapshot_directory or output_directory.rstrip('/\\') + '.snapshots')
+    manifest = {} if force else state.load_pages()
+    resumed, visited, todo = state.begin(resume=resume and not force, max_attempts=max_attempts)
+    frontier = asyncio.Queue()
+    parse_processes = os.cpu_count() if parse_processes is None else parse_processes
+    parse_queue = asyncio.Queue(maxsize=4 * max(parse_processes, 1))
+    limiter = HostRateLimiter(rate_per_host)
+    stats = {"resumed": resumed, "requests": 0, "pages": 0, "not_modified": 0, "unchanged": 0,
+             "skipped_by_lastmod": 0, "removed": 0, "retries": 0, "errors": 0, "parse_errors": 0,
+             "snapshots_compacted": False}
+    sitemap = {}
+
+    def schedule(url, delay=0.0):
+        if url not in visited:
+            visited.add(url)
+            state.add(url)
+            frontier.put_nowait((url, time.monotonic() + delay))
+
+    async def fetch(session, url):
+        """(HTML, URL after redirects) of the page if it has to be parsed, None if it has not changed."""
+        entry = manifest.setdefault(url, {})
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        await limiter.wait(url)
+        stats["requests"] += 1
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304:
+                stats["not_modified"] += 1
+                entry['lastmod'] = sitemap.get(url)
+                return None
+            response.raise_for_status()
+            if 'text/html' not in response.headers.get('Content-Type', ''):
+                return None
+            body = await response.read()
+            html = body.decode(response.get_encoding())
+            # адрес после редиректов, со слешем в конце, как на сайте; ключ манифеста остается нормализованным
+            page_url = str(response.url)
+
+        # lastmod записывается только после успешной загрузки, иначе упавшая страница пропустится в следующий раз
+        content_hash = hashlib.sha1(body).hexdigest()
+        changed = content_hash != entry.get('content_hash')
+        entry.update(etag=response.headers.get('ETag'), last_modified=response.headers.get('Last-Modified'),
+                     lastmod=sitemap.get(url), content_hash=content_hash)
+        if changed or url not in archive:
+            archive.put(url, body, response.get_encoding(), content_hash, base_url, page_url)
+        if not changed:
+            stats["unchanged"] += 1
+            return None
+        return html, page_url
+
+    def finish(url):
+        # ссылки страницы попадают в границу раньше отметки о ней - контрольная точка их не потеряет
+        state.put_page(url, manifest[url])
+        state.done(url)
+
+    async def worker(session):
+        while True:
+            url, not_before = await frontier.get()
+            try:
+                await asyncio.sleep(not_before - time.monotonic())
+                page = await fetch(session, url)
+            except Exception as e:
+                retry = is_retryable(e)
+                failures, delay = state.failed(url, str(e), retry_backoff_seconds, permanent=not retry)
+                if retry and failures < max_attempts:
+                    stats["retries"] += 1
+                    logger.info("Retrying %s in %.1fs after: %s", url, delay, e)
+                    frontier.put_nowait((url, time.monotonic() + delay))
+                else:
+                    stats["errors"] += 1
+                    logger.warning("Error processing %s after %d attempts: %s", url, failures, e)
+                frontier.task_done()
+                continue
+            if page is None:
+                finish(url)
+                frontier.task_done()
+            else:
+                # элемент границы закрывает стадия разбора, так frontier.join дождется и ссылок страницы
+                await parse_queue.put((url, *page))
+
+    async def parser(pool):
+        loop = asyncio.get_running_loop()
+        while True:
+            url, html, page_url = await parse_queue.get()
+            entry = manifest[url]
+            try:
+                if pool is None:
+                    meta_info, content_data, links = parse_page(page_url, html, base_url, parser_backend)
+                else:
+                    meta_info, content_data, links = await loop.run_in_executor(
+                        pool, parse_page, page_url, html, base_url, parser_backend)
+                entry['file'] = os.path.basename(save_page(output_directory, url, meta_info, content_data))
+                stats["pages"] += 1
+                if follow_links:
+                    for link in links:
+                        schedule(link)
+                finish(url)
+            except Exception as e:
+                # повторная загрузка разбор не исправит; без хеша и валидаторов следующий обход запросит страницу
+                # целиком, а не получит 304 или пропуск по lastmod, и разберет ее заново
+                stats["parse_errors"] += 1
+                logger.warning("Error parsing %s: %s", url, e)
+                for key in ('content_hash', 'etag', 'last_modified', 'lastmod'):
+                    entry.pop(key, None)
+                state.put_page(url, entry)
+                state.failed(url, f"parse error: {e}", retry_backoff_seconds, permanent=True)
+            finally:
+                parse_queue.task_done()
+                frontier.task_done()
+
+    async def checkpoints():
+        while True:
+            await asyncio.sleep(checkpoint_seconds)
+            archive.checkpoint()
+            state.checkpoint()
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    started = time.perf_counter()
+    pool = ProcessPoolExecutor(max_workers=parse_processes) if parse_processes else None
+    try:
+        async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+            # rustore.ru перенаправляет на www.rustore.ru: адреса карты сайта сравниваются с каноническим хостом
+            start_url = await resolve_url(session, start_url)
+            base_url = normalize_url(base_url or start_url)
+            sitemap_url = sitemap_url or base_url + '/sitemap.xml'
+            pages, sitemap_complete = await fetch_sitemap(session, sitemap_url, base_url)
+            sitemap.update(pages)
+            stats["sitemap_urls"] = len(sitemap)
+            # недообойденные страницы прерванного обхода, упавшие - с оставшейся задержкой
+            for url, delay in todo:
+                frontier.put_nowait((url, time.monotonic() + delay))
+            for url, lastmod in sitemap.items():
+                entry = manifest.setdefault(url, {})
+                entry['in_sitemap'] = True
+                if entry.get('content_hash'):
+                    state.put_page(url, entry)
+                if lastmod and lastmod == entry.get('lastmod') and entry.get('content_hash'):
+                    # страница не менялась с прошлого обхода - запрос не нужен
+                    visited.add(url)
+                    stats["skipped_by_lastmod"] += 1
+                else:
+                    schedule(url)
+            if not sitemap:
+                # без карты сайта известные страницы проверяются условными запросами
+                for url in list(manifest):
+                    schedule(url)
+            schedule(start_url)
+            state.checkpoint()
+
+            tasks = [asyncio.create_task(worker(session)) for _ in range(concurrency)]
+            # по два разборщика на процесс, чтобы процессы не простаивали между страницами
+            tasks += [asyncio.create_task(parser(pool)) for _ in range(2 * parse_processes or 1)]
+            tasks.append(asyncio.create_task(checkpoints()))
+            try:
+                await frontier.join()
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        if sitemap and not sitemap_complete:
+            # без части карты сайта ее страницы выглядели бы удаленными
+            logger.warning("Some sitemaps were not read, removed pages are kept until the next crawl")
+        elif sitemap:
+            for url in [url for url, entry in manifest.items() if entry.get('in_sitemap') and url not in sitemap]:
+                entry = manifest.pop(url)
+                if entry.get('file') and os.path.exists(os.path.join(output_directory, entry['file'])):
+                    os.remove(os.path.join(output_directory, entry['file']))
+                state.remove_page(url)
+                archive.remove(url)
+                stats["removed"] += 1
+        if archive.superseded_fraction() > compact_fraction:
+            archive.compact()
+            stats["snapshots_compacted"] = True
+        stats["failed_urls"] = sorted(state.failures())
+        state.finish()
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        archive.close()
+        state.close()
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    return stats
+
+
+def _reparse_records(archive_path, records, output_directory, backend):
+    for url, page_url, base_url, offset, length, encoding in records:
+        html = read_record(archive_path, offset, length).decode(encoding)
+        meta_info, content_data, _ = parse_page(page_url or url, html, base_url, backend)
+        save_page(output_directory, url, meta_info, content_data)
+    return len(records)
+
+
+def reparse_snapshots(snapshot_directory, output_directory=OUTPUT_DIRECTORY, processes=None, batch_size=32,
+                      backend='bs4'):
+    """
+    Offline reparse: runs parse_content (or its lxml version) over every page of the snapshot archive in
+    a process pool and rewrites the JSON files, without any request to the site. Returns the number of pages.
+    """
+    with SnapshotArchive(snapshot_directory) as archive:
+        archive_path, records = archive.path, archive.records()
+    batches = [records[i:i + batch_size] for i in range(0, len(records), batch_size)]
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return sum(executor.map(_reparse_records, [archive_path] * len(batches), batches,
+                                [output_directory] * len(batches), [backend] * len(batches)))
+
+
+def crawl_rustore():
+    """Replacement of parsser.parse_rustore without a browser."""
+    stats = asyncio.run(crawl())
+    print(f"Crawled {stats['pages']} pages in {stats['seconds']}s, errors: {stats['errors']}")
+    for url in stats['failed_urls']:
+        print(f"Failed: {url}")
+    return stats
+
+
+if __name__ == "__main__":
+    # обход локальной копии сайта: полный, затем повторный после изменения нескольких страниц,
+    # затем прерванный обход с 10% ответов 503, продолженный с контрольной точки, и разбор из снимков
+    # python -m update_docs.crawler
+    import tempfile
+    from aiohttp import web
+    from update_docs.test_site import make_site, make_app, touch_pages
+
+    async def run():
+        with tempfile.TemporaryDirectory() as directory:
+            site_directory = os.path.join(directory, "site")
+            pages = make_site(site_directory, pages=200)
+            runner = web.AppRunner(make_app(site_directory, latency_seconds=0.05))
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/help"
+            for concurrency in (1, 16):
+                stats = await crawl(url, output_directory=os.path.join(directory, f"out_{concurrency}"),
+                                    concurrency=concurrency, rate_per_host=0)
+                print(f"{pages} pages, concurrency={concurrency}: {stats}")
+
+            time.sleep(1)  # Last-Modified и lastmod с точностью до секунды
+            touch_pages(site_directory, [3, 7, 11])
+            stats = await crawl(url, output_directory=os.path.join(directory, "out_16"), rate_per_host=0)
+            print(f"refresh after 3 changed pages: {stats}")
+            await runner.cleanup()
+
+            runner = web.AppRunner(make_app(site_directory, latency_seconds=0.05, failure_rate=0.1))
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/help"
+            output_directory = os.path.join(directory, "out_resume")
+            task = asyncio.create_task(crawl(url, output_directory=output_directory, concurrency=4, rate_per_host=0,
+                                             retry_backoff_seconds=0.2, checkpoint_seconds=0.5))
+            await asyncio.sleep(2)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            print(f"interrupted after 2s with {len(os.listdir(output_directory))} pages saved")
+            stats = await crawl(url, output_directory=output_directory, concurrency=4, rate_per_host=0,
+                                retry_backoff_seconds=0.2)
+            print(f"resumed: {stats}, {len(os.listdir(output_directory))} pages saved")
+            await runner.cleanup()
+
+            for processes, backend in ((1, 'bs4'), (os.cpu_count(), 'bs4'), (os.cpu_count(), 'lxml')):
+                started = time.perf_counter()
+                pages = reparse_snapshots(output_directory + ".snapshots",
+                                          os.path.join(directory, f"reparsed_{processes}_{backend}"),
+                                          processes=processes, backend=backend)
+                print(f"reparsed {pages} pages from snapshots, processes={processes}, backend={backend}: "
+                      f"{time.perf_counter() - started:.2f}s")
+
+    asyncio.run(run())
@@ -0,0 +1,340 @@
+from urllib.parse import urljoin
+from datetime import datetime
+
+import lxml.html
+
+# lxml-версия обработчиков parse_html: тот же JSON без построения дерева BeautifulSoup.
+# Совпадение с parse_html проверяет check_parity.
+
+# как в get_text BeautifulSoup: текст скриптов и стилей не считается текстом элемента
+SKIPPED_TEXT_TAGS = ('script', 'style', 'template')
+
+
+def is_element(node):
+    # комментарии и инструкции обработки в lxml тоже узлы, но их tag - не строка
+    return isinstance(node.tag, str)
+
+
+def classes(element):
+    return element.get('class', '').split()
+
+
+def strings(element):
+    """Text nodes of the element in document order, as BeautifulSoup _all_strings sees them."""
+    if is_element(element) and element.tag not in SKIPPED_TEXT_TAGS and element.text:
+        yield element.text
+    for child in element:
+        if is_element(child):
+            yield from strings(child)
+        if child.tail:
+            yield child.tail
+
+
+def stripped_strings(element):
+    for text in strings(element):
+        text = text.strip()
+        if text:
+            yield text
+
+
+def get_text(element):
+    """element.get_text(strip=True)"""
+    return ''.join(stripped_strings(element))
+
+
+def find_all(element, tag, class_=None, recursive=True):
+    nodes = element.iterdescendants() if recursive else iter(element)
+    return [node for node in nodes
+            if is_element(node) and (tag is None or node.tag == tag) and (class_ is None or class_ in classes(node))]
+
+
+def find(element, tag, class_=None):
+    for node in element.iterdescendants():
+        if is_element(node) and (tag is None or node.tag == tag) and (class_ is None or class_ in classes(node)):
+            return node
+    return None
+
+
+def link_data(link, base_url):
+    return {
+        "text": get_text(link),
+        "url": urljoin(base_url, link.attrib['href'])
+    }
+
+
+def get_meta_information(tree, current_url):
+    language_meta = None
+    for meta in find_all(tree, 'meta'):
+        if meta.get('name') == 'docusaurus_locale':
+            language_meta = meta
+            break
+    language = language_meta.attrib['content'] if language_meta is not None else 'unknown'
+    doc_section = ''
+    url_parts = current_url.split('/')
+    for section in ('developers', 'users', 'sdk', 'api', 'guides'):
+        if section in url_parts:
+            doc_section = section
+            break
+
+    return {
+        "language": language,
+        "parse_date": datetime.now().isoformat(),
+        "current_url": current_url,
+        "doc_section": doc_section
+    }
+
+
+def handle_header(element):
+    return {
+        "type": element.tag,
+        "text": get_text(element),
+        "content": []
+    }
+
+
+def handle_admonition(element, base_url):
+    admonition_type = 'unknown'
+    for name in ('note', 'caution', 'warning', 'info'):
+        if f'theme-admonition-{name}' in classes(element):
+            admonition_type = name
+            break
+
+    admonition_data = {
+        "type": "admonition",
+        "admonition_type": admonition_type,
+        "title": get_text(find(element, 'div', 'admonitionHeading_Gvgb')),
+        "content": []
+    }
+
+    content_area = find(element, 'div', 'admonitionContent_BuS1')
+    for content_element in find_all(content_area, 'p', recursive=False):
+        admonition_data['content'].append({
+            "type": "paragraph",
+            "text": get_text(content_element),
+            "links": [link_data(link, base_url) for link in find_all(content_element, 'a')]
+        })
+
+    return admonition_data
+
+
+def handle_list(element, base_url):
+    return {
+        "type": "ordered" if element.tag == 'ol' else "unordered",
+        "items": [{
+            "text": get_text(item),
+            "links": [link_data(link, base_url) for link in find_all(item, 'a')]
+        } for item in find_all(element, 'li', recursive=False)]
+    }
+
+
+def handle_code_block(element):
+    if 'theme-code-block' in classes(element):
+        return {
+            "type": "code",
+            "text": ''.join(stripped_strings(element))
+        }
+    return None
+
+
+def handle_paragraph(element):
+    return {
+        "type": "paragraph",
+        "text": get_text(element)
+    }
+
+
+def handle_table(element, base_url):
+    table_data = {
+        "type": "table",
+        "headers": [],
+        "rows": []
+    }
+
+    thead = find(element, 'thead')
+    if thead is not None:
+        header_elements = find_all(thead, 'th')
+    else:
+        first_row = find(element, 'tr')
+        header_elements = find_all(first_row, 'th') or find_all(first_row, 'td')
+    table_data['headers'] = [get_text(header) for header in header_elements]
+
+    tbody = find(element, 'tbody')
+    if tbody is None:
+        tbody = element
+    rows_to_parse = find_all(tbody, 'tr')[1:] if thead is None else find_all(tbody, 'tr')
+
+    for row in rows_to_parse:
+        table_data['rows'].append([{
+            "text": ' '.join(stripped_strings(cell)),
+            "links": [link_data(link, base_url) for link in find_all(cell, 'a')]
+        } for cell in find_all(row, 'td')])
+
+    return table_data
+
+
+def handle_details(element, base_url):
+    details_data = {
+        "type": "details",
+        "summary": get_text(find(element, 'summary')),
+        "content": []
+    }
+
+    content_area = find(element, 'div')
+    for content_element in content_area.iterdescendants():
+        if content_element.tag == 'p':
+            details_data['content'].append({
+                "type": "paragraph",
+                "text": get_text(content_element),
+                "links": [link_data(link, base_url) for link in find_all(content_element, 'a')]
+            })
+        elif content_element.tag in ('ul', 'ol'):
+            details_data['content'].append(handle_list(content_element, base_url))
+
+    return details_data
+
+
+def handle_tabs(element, base_url):
+    tabs_data = []
+    tabs = find_all(element, None, 'tabs__item')
+    tab_panels = find_all(element, None, 'tabItem_Ymn6')
+
+    for tab, panel in zip(tabs, tab_panels):
+        tab_content_list = []
+        for item in find_all(panel, 'li'):
+            paragraph = find(item, 'p')
+            if paragraph is not None:
+                tab_content_list.append({
+                    "type": "paragraph",
+                    "text": get_text(paragraph),
+                    "links": [link_data(link, base_url) for link in find_all(paragraph, 'a')]
+                })
+        tabs_data.append({
+            "tab_label": get_text(tab),
+            "content": tab_content_list
+        })
+
+    return tabs_data
+
+
+def parse_content(tree, base_url):
+    content_area = None
+    for element in tree.iter():
+        if is_element(element) and {'theme-doc-markdown', 'markdown'} <= set(classes(element)):
+            content_area = element
+            break
+    if content_area is None:
+        return []
+
+    content_list = []
+    for element in content_area:
+        if not is_element(element):
+            continue
+        element_classes = classes(element)
+        if element.tag in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
+            content_list.append(handle_header(element))
+        elif element.tag == 'p':
+            if content_list and isinstance(content_list[-1], dict) and 'content' in content_list[-1]:
+                content_list[-1]['content'].append(handle_paragraph(element))
+        elif element.tag in ['ul', 'ol']:
+            content_list.append(handle_list(element, base_url))
+        elif element.tag == 'table':
+            content_list.append(handle_table(element, base_url))
+        elif element.tag == 'div' and 'tabs-container' in element_classes:
+            content_list.extend(handle_tabs(element, base_url))
+        elif 'theme-admonition' in element_classes:
+            content_list.append(handle_admonition(element, base_url))
+        elif element.tag == 'details':
+            content_list.append(handle_details(element, base_url))
+        elif 'theme-code-block' in element_classes:
+            code_block = handle_code_block(element)
+            if code_block:
+                content_list.append(code_block)
+
+    return content_list
+
+
+def parse_html(html):
+    return lxml.html.document_fromstring(html)
+
+
+def check_parity(pages, base_url):
+    """
+    Compares the JSON of parse_html and of this module on (url, html) pages, parse_date aside.
+    Returns [(url, BeautifulSoup result, lxml result)] of the pages where they differ.
+    """
+    from bs4 import BeautifulSoup
+    from update_docs import parse_html as reference
+
+    mismatches = []
+    for url, html in pages:
+        soup = BeautifulSoup(html, 'lxml')
+        expected = {"meta": reference.get_meta_information(soup, url),
+                    "content": reference.parse_content(soup, base_url)}
+        tree = parse_html(html)
+        actual = {"meta": get_meta_information(tree, url), "content": parse_content(tree, base_url)}
+        expected["meta"].pop("parse_date")
+        actual["meta"].pop("parse_date")
+        if expected != actual:
+            mismatches.append((url, expected, actual))
+    return mismatches
+
+
+EDGE_CASES = """<html><head><meta name="docusaurus_locale" content="en"></head><body>
+<div class="markdown theme-doc-markdown extra">
+<h2>Заголовок <code>inline</code> &amp; <!-- комментарий --> текст</h2>
+<p>Абзац с <a href="/x">ссылкой</a><script>var x = 1;</script> и хвостом</p>
+<ol><li>Первый <ul><li>вложенный</li></ul></li><li><a href="https://example.com/y">внешняя</a></li></ol>
+<table><tr><td>без</td><td>thead</td></tr><tr><td>a <b>b</b></td><td><a href="z">c</a></td></tr></table>
+<table><tr><th>заголовок</th></tr><tr><td>ячейка</td></tr></table>
+<div class="theme-admonition theme-admonition-warning"><div class="admonitionHeading_Gvgb">Внимание</div>
+<div class="admonitionContent_BuS1">текст<p>первый</p><div><p>вложенный не берется</p></div></div></div>
+<details><summary>Ещё</summary><div><div><p>глубоко <a href="#a">якорь</a></p></div><ol><li>пункт</li></ol></div></details>
+<div class="theme-code-block"><pre><code><span>line 1</span>
+<span>  line 2</span></code></pre></div>
+<div class="tabs-container"><ul><li class="tabs__item">A</li><li class="tabs__item">B</li></ul>
+<div class="tabItem_Ymn6"><ul><li>без абзаца</li><li><p>с абзацем</p></li></ul></div></div>
+</div></body></html>"""
+
+
+if __name__ == "__main__":
+    # сравнение с parse_html и скорость: python -m update_docs.parse_lxml [snapshot_directory]
+    import os
+    import sys
+    import time
+    import tempfile
+
+    if len(sys.argv) > 1:
+        from update_docs.snapshots import SnapshotArchive
+
+        with SnapshotArchive(sys.argv[1]) as archive:
+            records = archive.records()
+            base_url = records[0][2] if records else ''
+            pages = [(page_url, archive.get(url)) for url, page_url, *_ in records]
+    else:
+        from update_docs.test_site import make_site, page_path
+
+        base_url = 'https://rustore.ru/help'
+        with tempfile.TemporaryDirectory() as directory:
+            count = make_site(directory, pages=200)
+            pages = []
+            for n in range(count):
+                with open(os.path.join(directory, page_path(n) if n else 'help', 'index.html'), encoding='utf-8') as f:
+                    pages.append((f"https://rustore.ru/{page_path(n)}", f.read()))
+        pages.append((base_url + '/edge-cases', EDGE_CASES))
+
+    mismatches = check_parity(pages, base_url)
+    print(f"{len(pages)} pages, {len(mismatches)} differ")
+    for url, expected, actual in mismatches[:5]:
+        print(url, expected, actual, sep='\n')
+
+    from bs4 import BeautifulSoup
+    from update_docs import parse_html as reference
+
+    started = time.perf_counter()
+    for url, html in pages:
+        reference.parse_content(BeautifulSoup(html, 'lxml'), base_url)
+    print(f"BeautifulSoup: {time.perf_counter() - started:.2f}s")
+    started = time.perf_counter()
+    for url, html in pages:
+        parse_content(parse_html(html), base_url)
+    print(f"lxml: {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,118 @@
+import os
+import gzip
+import sqlite3
+from datetime import datetime, timezone
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    url TEXT PRIMARY KEY,
+    page_url TEXT,
+    base_url TEXT,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    encoding TEXT,
+    content_hash TEXT,
+    fetched_at TEXT
+);
+"""
+
+
+def _record(url, body, content_type, fetched_at):
+    header = (f"WARC/1.1\r\nWARC-Type: response\r\nWARC-Target-URI: {url}\r\nWARC-Date: {fetched_at}\r\n"
+              f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n\r\n")
+    return header.encode('utf-8') + body + b"\r\n\r\n"
+
+
+def read_record(path, offset, length):
+    """Raw HTML of one record of an archive file."""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = gzip.decompress(f.read(length))
+    _, _, body = data.partition(b"\r\n\r\n")
+    return body[:-4]
+
+
+class SnapshotArchive:
+    """
+    Raw HTML of crawled pages in a WARC-like archive: pages.warc.gz is a sequence of gzip members, one per
+    response, so a record is read by seek + decompress of its own bytes; index.sqlite points every URL to its
+    latest record. New snapshots are appended, the older record of a URL stays in the file until compact().
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.path = os.path.join(directory, 'pages.warc.gz')
+        self.index = sqlite3.connect(os.path.join(directory, 'index.sqlite'))
+        self.index.executescript(INDEX_SCHEMA)
+        self.file = open(self.path, 'ab')
+
+    def close(self):
+        self.file.close()
+        self.index.commit()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __contains__(self, url):
+        return self.index.execute("SELECT 1 FROM snapshots WHERE url = ?", (url,)).fetchone() is not None
+
+    def __len__(self):
+        return self.index.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0]
+
+    def put(self, url, body, encoding='utf-8', content_hash=None, base_url=None, page_url=None):
+        """page_url is the address the page was served from after redirects, url by default."""
+        page_url = page_url or url
+        fetched_at = datetime.now(timezone.utc).isoformat()
+        member = gzip.compress(_record(page_url, body, f"text/html; charset={encoding}", fetched_at),
+                               compresslevel=6)
+        offset = self.file.tell()
+        self.file.write(member)
+        self.file.flush()
+        self.index.execute("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                           (url, page_url, base_url, offset, len(member), encoding, content_hash, fetched_at))
+
+    def remove(self, url):
+        self.index.execute("DELETE FROM snapshots WHERE url = ?", (url,))
+
+    def checkpoint(self):
+        self.index.commit()
+
+    def get(self, url):
+        """Decoded HTML of the latest snapshot of the URL, None if there is none."""
+        row = self.index.execute("SELECT offset, length, encoding FROM snapshots WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        offset, length, encoding = row
+        return read_record(self.path, offset, length).decode(encoding)
+
+    def records(self):
+        """(url, page_url, base_url, offset, length, encoding) of every page in file order."""
+        return self.index.execute(
+            "SELECT url, page_url, base_url, offset, length, encoding FROM snapshots ORDER BY offset").fetchall()
+
+    def superseded_fraction(self):
+        """Share of the archive file taken by records no URL points to any more (older or removed pages)."""
+        self.file.flush()
+        size = os.path.getsize(self.path)
+        live = self.index.execute("SELECT COALESCE(SUM(length), 0) FROM snapshots").fetchone()[0]
+        return 1 - live / size if size else 0.0
+
+    def compact(self):
+        """Rewrites the archive with only the latest record of every URL."""
+        self.file.close()
+        tmp_path = self.path + '.tmp'
+        moved = []
+        with open(self.path, 'rb') as source, open(tmp_path, 'wb') as target:
+            for url, _, _, offset, length, _ in self.records():
+                source.seek(offset)
+                moved.append((target.tell(), url))
+                target.write(source.read(length))
+        os.replace(tmp_path, self.path)
+        self.index.executemany("UPDATE snapshots SET offset = ? WHERE url = ?", moved)
+        self.index.commit()
+        self.file = open(self.path, 'ab')
@@ -0,0 +1,155 @@
+import os
+import time
+import random
+import asyncio
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+SECTIONS = ("developers", "users", "sdk", "api", "guides")
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="ru">
+<head>
+<meta charset="utf-8">
+<meta name="docusaurus_locale" content="ru">
+<title>{title}</title>
+</head>
+<body>
+<nav>{nav}</nav>
+<article>
+<div class="theme-doc-markdown markdown">
+<h1>{title}</h1>
+<p>{paragraph}</p>
+<h2>Подключение</h2>
+<p>{paragraph}</p>
+<ul>
+<li>Откройте <a href="{link}">раздел</a> консоли.</li>
+<li>Заполните анкету приложения.</li>
+</ul>
+<div class="theme-admonition theme-admonition-note alert">
+<div class="admonitionHeading_Gvgb">Примечание</div>
+<div class="admonitionContent_BuS1"><p>Проверьте версию SDK, см. <a href="{link}">документацию</a>.</p></div>
+</div>
+<table>
+<thead><tr><th>Параметр</th><th>Описание</th></tr></thead>
+<tbody>
+<tr><td>appId</td><td>Идентификатор приложения, <a href="{link}">где найти</a></td></tr>
+<tr><td>token</td><td>Токен доступа</td></tr>
+</tbody>
+</table>
+<div class="tabs-container tabList_abc">
+<ul class="tabs"><li class="tabs__item">Kotlin</li><li class="tabs__item">Java</li></ul>
+<div class="tabItem_Ymn6"><ul><li><p>Добавьте зависимость в build.gradle.</p></li></ul></div>
+<div class="tabItem_Ymn6"><ul><li><p>Вызовите метод <a href="{link}">init</a>.</p></li></ul></div>
+</div>
+<details><summary>Частые ошибки</summary><div><p>Ошибка подписи: проверьте ключ.</p><ul><li>Пересоберите приложение.</li></ul></div></details>
+<div class="theme-code-block language-kotlin"><pre><code>val client = RuStoreClient.init(appId)</code></pre></div>
+</div>
+</article>
+</body>
+</html>
+"""
+
+
+def page_path(n: int) -> str:
+    return f"help/{SECTIONS[n % len(SECTIONS)]}/page-{n}"
+
+
+def make_site(directory: str, pages: int = 200, links_per_page: int = 8, seed: int = 0) -> int:
+    """
+    Writes a synthetic Docusaurus-like copy of rustore.ru/help: `pages` pages under help/<section>/page-<n>/
+    (page 0 is help/ itself) with the same markup parse_content handles, each linking to a few other pages.
+    Returns the page count.
+    """
+    rng = random.Random(seed)
+    for n in range(pages):
+        links = [f"/{page_path(rng.randrange(1, pages))}" for _ in range(links_per_page)]
+        # первая страница ссылается на все, чтобы обход из /help находил весь сайт
+        if n == 0:
+            links += [f"/{page_path(i)}" for i in range(1, pages)]
+        nav = ''.join(f'<a href="{link}#anchor">ссылка</a>' for link in links)
+        html = PAGE_TEMPLATE.format(title=f"Страница {n}", nav=nav, link=links[0],
+                                    paragraph=f"Описание возможности номер {n}. " * 5)
+        path = os.path.join(directory, page_path(n) if n else "help")
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "index.html"), "w", encoding="utf-8") as f:
+            f.write(html)
+    write_sitemap(directory)
+    return pages
+
+
+def write_sitemap(directory: str) -> None:
+    """help/sitemap.xml with every page and the modification time of its file as lastmod, like Docusaurus."""
+    help_root = os.path.join(directory, "help")
+    entries = []
+    for folder, _, files in sorted(os.walk(help_root)):
+        if "index.html" not in files:
+            continue
+        mtime = os.stat(os.path.join(folder, "index.html")).st_mtime
+        relative = os.path.relpath(folder, directory).replace(os.sep, "/")
+        lastmod = datetime.fromtimestamp(mtime, timezone.utc).isoformat()
+        entries.append(f"<url><loc>{{base}}/{relative}</loc><lastmod>{lastmod}</lastmod></url>")
+    with open(os.path.join(help_root, "sitemap.xml"), "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">' + "".join(entries) + "</urlset>")
+
+
+def touch_pages(directory: str, pages: list) -> None:
+    """Changes the text of the given pages (as a documentation update would) and rewrites the sitemap."""
+    for n in pages:
+        path = os.path.join(directory, page_path(n) if n else "help", "index.html")
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(html.replace("</h1>", f"</h1>\n<p>Обновлено {time.time()}.</p>", 1))
+    write_sitemap(directory)
+
+
+def make_app(directory: str, latency_seconds: float = 0.0, failure_rate: float = 0.0,
+             seed: int = 0) -> web.Application:
+    """
+    Serves the site like a static host: /help/x is help/x/index.html, /help/sitemap.xml lists the pages.
+    Optional per-request latency and a share of pages answered with 503.
+    """
+    root = os.path.abspath(directory)
+    rng = random.Random(seed)
+
+    async def handle(request):
+        if latency_seconds:
+            await asyncio.sleep(latency_seconds)
+        if failure_rate and not request.path.endswith("sitemap.xml") and rng.random() < failure_rate:
+            raise web.HTTPServiceUnavailable()
+        relative = request.match_info["path"].strip("/")
+        path = os.path.abspath(os.path.join(root, relative))
+        if not path.startswith(root):
+            raise web.HTTPForbidden()
+        if os.path.isdir(path):
+            # как Docusaurus с trailingSlash: адрес страницы без слеша перенаправляется на адрес со слешем
+            if not request.path.endswith("/"):
+                raise web.HTTPMovedPermanently(request.path + "/")
+            path = os.path.join(path, "index.html")
+        if not os.path.isfile(path):
+            raise web.HTTPNotFound()
+        if path.endswith("sitemap.xml"):
+            # адреса в карте сайта указывают на тот хост, с которого ее запросили
+            with open(path, encoding="utf-8") as f:
+                xml = f.read().replace("{base}", f"{request.scheme}://{request.host}")
+            return web.Response(text=xml, content_type="application/xml")
+        # FileResponse отдает ETag и Last-Modified и отвечает 304 на условные запросы
+        return web.FileResponse(path)
+
+    app = web.Application()
+    app.router.add_get("/{path:.*}", handle)
+    return app
+
+
+if __name__ == "__main__":
+    # python -m update_docs.test_site ./test_site 8081
+    import sys
+
+    directory = sys.argv[1] if len(sys.argv) > 1 else "./test_site"
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8081
+    if not os.path.exists(os.path.join(directory, "help")):
+        make_site(directory)
+    web.run_app(make_app(directory), host="127.0.0.1", port=port)
@@ -1,10 +1,39 @@
+import os
+import uuid
+import logging
+import hashlib
 import pandas as pd
 import joblib
 from utils.ranking import MyExistingRetrievalPipeline
+from utils.colbert_index import COLBERT_MODEL_NAME, ColbertDocumentIndex
+
+logger = logging.getLogger(__name__)
+
+INDEX_DIR = "./indexes_upd"
+INDEX_PATH = os.path.join(INDEX_DIR, "indexes_cp.index")
+STORE_PATH = os.path.join(INDEX_DIR, "chunks")
+BM25_PATH = os.path.join(INDEX_DIR, "bm_cp.bm25")
+HASHES_PATH = os.path.join(INDEX_DIR, "chunk_hashes.pkl")
+COLBERT_PATH = os.path.join(INDEX_DIR, "colbert")
+VERSION_PATH = os.path.join(INDEX_DIR, "version.txt")
+
+# при большой доле удаленных фрагментов индекс пересобирается целиком
+MAX_DELETED_FRACTION = 0.3
+
 
 def save_file(file, file_name):
     joblib.dump(file, file_name)
 
+
+def chunk_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def chunk_key(url, text_hash):
+    # одинаковый текст на разных страницах - разные фрагменты: у каждого свои метаданные и свой id
+    return url, text_hash
+
+
 def get_df(pikle_file):
 
     data = joblib.load(pikle_file)
@@ -36,27 +65,92 @@ def get_df(pikle_file):
         'Section': sections,
         'Header': headers,
         'Content': contents
-    })  
+    })
 
-    save_file(df['Meta'].tolist(), './indexes_upd/meta.pkl')
-    df['Meta'] = " Parse date: " + df['Dates'] + " Url: " + df['Urls'] + " Section: " + df['Section'] + " Header " + df['Header']
     df['Full_Content'] = df['Header'] + ' ' + df['Content']
-    save_file(df['Full_Content'].tolist(), './indexes_upd/content_new.pkl')
-    
-    return df
+    df['Hash'] = df['Full_Content'].map(chunk_hash)
+
+    return df.drop_duplicates(['Urls', 'Hash']).reset_index(drop=True)
+
 
-def update_indexes():
+def load_state():
+    """Loads the saved index state or returns None if there is nothing to update incrementally."""
+    paths = (INDEX_PATH, STORE_PATH, BM25_PATH, HASHES_PATH)
+    if not all(os.path.exists(path) for path in paths):
+        return None
 
+    hashes = joblib.load(HASHES_PATH)
+    deleted = sum(h is None for h in hashes)
+    if hashes and deleted / len(hashes) > MAX_DELETED_FRACTION:
+        return None
+
+    pipeline = MyExistingRetrievalPipeline()
+    pipeline.load_index(INDEX_PATH, STORE_PATH, BM25_PATH)
+    return pipeline, hashes, list(pipeline.store.texts), list(pipeline.store.metas)
+
+
+def update_colbert_index(contents, reuse_ids):
+    """Precomputes ColBERT token embeddings for reranking by chunk id, reusing unchanged chunks."""
+    from ragatouille import RAGPretrainedModel
+
+    RAG = RAGPretrainedModel.from_pretrained(COLBERT_MODEL_NAME)
+    previous = ColbertDocumentIndex.load(COLBERT_PATH) if reuse_ids and os.path.exists(COLBERT_PATH) else None
+    colbert_index = ColbertDocumentIndex.build(RAG.model.inference_ckpt, contents,
+                                               previous=previous, reuse_ids=reuse_ids if previous else None)
+    colbert_index.save(COLBERT_PATH)
+
+
+def update_indexes(incremental=True):
+    """
+    Updates the indexes from processed_langchain_docs.pkl.
+    In incremental mode only new or changed chunks (by page and content hash) are embedded, removed chunks are
+    marked as deleted. Ids stay stable: the chunk store and chunk_hashes.pkl are aligned with index ids,
+    deleted positions hold empty values.
+    """
+    os.makedirs(INDEX_DIR, exist_ok=True)
     df = get_df(pikle_file="./parser/processed_langchain_docs.pkl")
 
-    index_pipeline = MyExistingRetrievalPipeline()
-    index_pipeline.index_documents(df, batch_size=512)
+    state = load_state() if incremental else None
+    if state is None:
+        index_pipeline = MyExistingRetrievalPipeline()
+        hashes, contents, metas = [], [], []
+    else:
+        index_pipeline, hashes, contents, metas = state
 
-    index_pipeline.save_index(index_file_path="./indexes_upd/indexes_cp.index", 
-                              map_file_path="./indexes_upd/collection_cp.pkl", 
-                              doc_texts_path="./indexes_upd/bm_cp.pkl"
-                            )
+    # фрагмент определяется страницей и хешем текста; страница берется из сохраненных метаданных
+    old_ids = {chunk_key(meta.get('current_url', 'url'), h): idx
+               for idx, (h, meta) in enumerate(zip(hashes, metas)) if h is not None}
+    keys = [chunk_key(url, h) for url, h in zip(df['Urls'], df['Hash'])]
+    is_kept = [key in old_ids for key in keys]
+    new_keys = set(keys)
+
+    removed = [idx for key, idx in old_ids.items() if key not in new_keys]
+    index_pipeline.remove_documents(removed)
+    for idx in removed:
+        hashes[idx], contents[idx], metas[idx] = None, '', {}
+
+    kept = df[is_kept]
+    for row in kept.itertuples():
+        metas[old_ids[chunk_key(row.Urls, row.Hash)]] = row.Meta
 
+    added = df[[not k for k in is_kept]]
+    new_ids = list(range(len(hashes), len(hashes) + len(added)))
+    index_pipeline.add_documents(added['Full_Content'].tolist(), new_ids, batch_size=512)
+    hashes.extend(added['Hash'])
+    contents.extend(added['Full_Content'])
+    metas.extend(added['Meta'])
 
+    logger.info("Chunks added: %d, removed: %d, unchanged: %d", len(added), len(removed), len(kept))
+
+    index_pipeline.set_chunks(contents, metas)
+    index_pipeline.save_index(index_file_path=INDEX_PATH,
+                              store_path=STORE_PATH,
+                              bm25_path=BM25_PATH
+                            )
+    save_file(hashes, HASHES_PATH)
 
+    update_colbert_index(contents, reuse_ids={old_ids[chunk_key(row.Urls, row.Hash)] for row in kept.itertuples()})
 
+    # новая версия индекса сбрасывает кэш ответов
+    with open(VERSION_PATH, 'w', encoding='utf-8') as f:
+        f.write(uuid.uuid4().hex)
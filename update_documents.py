@@ -4,7 +4,7 @@ from update_docs.split_docs import split
 from update_docs.parse_json import parse
 from update_docs.update import update_indexes
 # Расскомментировать для запуска парсинга
-# from update_docs.parsser import parse_rustore
+# from update_docs.crawler import crawl_rustore
 
 def load_page2():
     st.title("Обновление документации")
@@ -14,7 +14,7 @@ def load_page2():
     if st.button("Обновить документацию"):
         # Расскомментировать для запуска парсинга
         # with st.spinner("Парсим документацию...")
-        #     parse_rustore()
+        #     crawl_rustore()
         # st.succes("Parsing complete succesfully.")
         with st.spinner("Обрабатываем JSON файлы..."):
             parse()
@@ -0,0 +1,110 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def read_index_version(path: str) -> Optional[str]:
+    """Version written by update_indexes, None when the file is missing."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+class SemanticAnswerCache:
+    """
+    Caches answers by query embedding: a new query reuses the answer of a previous one when their
+    cosine similarity is at least `threshold` and both went to the same model.
+    Entries expire after `ttl_seconds`, the least recently used are evicted above `max_entries`,
+    and everything is dropped when the index version file changes.
+    With serve=False the cache only logs the closest cached queries (for choosing the threshold)
+    and never returns an answer.
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl_seconds: float = 3600, max_entries: int = 1000,
+                 version_path: Optional[str] = None, serve: bool = True, log_top: int = 3):
+        self.threshold = threshold
+        self.serve = serve
+        self.log_top = log_top
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.version_path = version_path
+        self.version = read_index_version(version_path) if version_path else None
+        self._version_mtime = self._mtime()
+        self._entries = OrderedDict()  # key -> (model_name, embedding, value, created_at, query)
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _mtime(self) -> Optional[float]:
+        if self.version_path and os.path.exists(self.version_path):
+            return os.stat(self.version_path).st_mtime
+        return None
+
+    def _check_version(self) -> None:
+        mtime = self._mtime()
+        if mtime == self._version_mtime:
+            return
+        self._version_mtime = mtime
+        version = read_index_version(self.version_path)
+        if version != self.version:
+            self.version = version
+            self._entries.clear()
+
+    def _expire(self, now: float) -> None:
+        expired = [key for key, (_, _, _, created_at, _) in self._entries.items()
+                   if now - created_at > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32)
+        return embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+
+    def get(self, embedding, model_name: str, query: Optional[str] = None) -> Optional[Any]:
+        embedding = self._normalize(embedding)
+        with self._lock:
+            self._check_version()
+            self._expire(time.time())
+            keys = [key for key, entry in self._entries.items() if entry[0] == model_name]
+            if keys:
+                matrix = np.stack([self._entries[key][1] for key in keys])
+                similarities = matrix @ embedding
+                best = int(np.argmax(similarities))
+                if self.log_top:
+                    # пары запросов с их сходством - материал для подбора threshold по логам
+                    top = np.argsort(-similarities)[:self.log_top]
+                    logger.info("answer cache %r: %s", query, ", ".join(
+                        f"{similarities[i]:.4f} {self._entries[keys[i]][4]!r}" for i in top))
+                if self.serve and similarities[best] >= self.threshold:
+                    self._entries.move_to_end(keys[best])
+                    self.hits += 1
+                    return self._entries[keys[best]][2]
+            self.misses += 1
+            return None
+
+    def put(self, embedding, model_name: str, value: Any, query: Optional[str] = None) -> None:
+        embedding = self._normalize(embedding)
+        with self._lock:
+            self._check_version()
+            self._entries[self._next_key] = (model_name, embedding, value, time.time(), query)
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
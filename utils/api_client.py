@@ -0,0 +1,58 @@
+import json
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from utils.config import ServingConfig
+
+
+class ApiClient:
+    """Client of api.py for the Streamlit UI; returns the same tuples as the in-process functions in utils/serving.py."""
+
+    def __init__(self, base_url: str, timeout: Optional[float] = None):
+        timeout = timeout or ServingConfig().request_timeout_seconds
+        self.client = httpx.Client(base_url=base_url, timeout=httpx.Timeout(timeout, connect=5.0))
+
+    def _events(self, payload: Dict) -> Iterator[Dict]:
+        with self.client.stream("POST", "/chat", json=payload) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    event = json.loads(line)
+                    if event["event"] == "error":
+                        # сервер перегружен: слот генерации не освободился за время ожидания
+                        raise httpx.HTTPStatusError(event["detail"], request=response.request, response=response)
+                    yield event
+
+    def stream_answers(self, query: str, models: List[str]) -> Iterator[Tuple[str, str, List[Dict], bool]]:
+        """(model, answer so far, docs, done) as the answers are streamed, like process_query_concurrent."""
+        answers, docs = {}, []
+        for event in self._events({"query": query, "models": models}):
+            if event["event"] == "docs":
+                docs = event["docs"]
+                yield None, '', docs, False
+                continue
+            name = event["model"]
+            answers[name] = answers.get(name, '') + event["delta"]
+            yield name, answers[name], docs, event["done"]
+
+    def answer_hedged(self, query: str) -> Tuple[str, str, List[Dict]]:
+        """(model, answer, docs) of the fastest acceptable answer, like process_query_hedged."""
+        name, answer, docs = None, '', []
+        for event in self._events({"query": query, "hedged": True}):
+            if event["event"] == "docs":
+                docs = event["docs"]
+            else:
+                name, answer = event["model"], answer + event["delta"]
+        return name, answer, docs
+
+    def documents(self, query: str) -> Tuple[str, List[Dict]]:
+        response = self.client.post("/documents", json={"query": query})
+        response.raise_for_status()
+        result = response.json()
+        return result["prompt"], result["docs"]
+
+    def metrics(self) -> Dict:
+        response = self.client.get("/metrics")
+        response.raise_for_status()
+        return response.json()
@@ -0,0 +1,134 @@
+import os
+import re
+import json
+from functools import lru_cache
+from typing import List, Tuple
+
+import numpy as np
+from nltk.stem.snowball import SnowballStemmer
+
+TOKEN_RE = re.compile(r"[0-9a-zа-яё]+")
+CYRILLIC_RE = re.compile(r"[а-я]")
+
+STOPWORDS = frozenset("""
+    а без более бы был была были было быть в вам вас весь во вот все всего всех вы где да даже для до его ее если есть
+    еще же за здесь и из или им их к как ко когда кто ли либо мне может мы на над надо наш не него нее нет ни них но
+    ну о об однако он она они оно от очень по под при с со так также такой там те тем то того тоже той только том ты
+    у уже хотя чего чей чем что чтобы чье чья эта эти это я
+    a an and are as at be by for from in is it of on or that the this to with
+""".split())
+
+_stemmers = {
+    "ru": SnowballStemmer("russian"),
+    "en": SnowballStemmer("english"),
+}
+
+
+@lru_cache(maxsize=200_000)
+def _stem(word: str) -> str:
+    if word.isdigit():
+        return word
+    lang = "ru" if CYRILLIC_RE.search(word) else "en"
+    return _stemmers[lang].stem(word)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, fold ё to е, drop stopwords and stem russian/english words."""
+    text = text.lower().replace("ё", "е")
+    return [_stem(token) for token in TOKEN_RE.findall(text) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Inverted BM25 index: postings (doc ids + term frequencies) stored term by term in flat arrays.
+    Saved as a directory of .npy files which are memory-mapped on load.
+    """
+
+    def __init__(self, vocab, offsets, doc_ids, tfs, doc_lens, idf, k1=1.5, b=0.75):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lens = doc_lens
+        self.idf = idf
+        self.k1 = k1
+        self.b = b
+        self.avgdl = float(doc_lens.mean()) if len(doc_lens) else 0.0
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.doc_lens)
+
+    @classmethod
+    def build(cls, texts: List[str], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        """Tokenizes texts and builds postings; a doc id is the position of the text in `texts`."""
+        vocab = {}
+        postings = []
+        doc_lens = np.zeros(len(texts), dtype=np.int32)
+
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text or "")
+            doc_lens[doc_id] = len(tokens)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                term_id = vocab.setdefault(token, len(vocab))
+                if term_id == len(postings):
+                    postings.append([])
+                postings[term_id].append((doc_id, tf))
+
+        offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(p) for p in postings])
+        doc_ids = np.fromiter((d for p in postings for d, _ in p), dtype=np.int32, count=offsets[-1])
+        tfs = np.fromiter((min(tf, 65535) for p in postings for _, tf in p), dtype=np.uint16, count=offsets[-1])
+
+        df = np.diff(offsets).astype(np.float64)
+        n = len(texts)
+        idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        return cls(vocab, offsets, doc_ids, tfs, doc_lens, idf, k1=k1, b=b)
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "vocab.json"), "w", encoding="utf-8") as f:
+            json.dump(self.vocab, f, ensure_ascii=False)
+        with open(os.path.join(path, "params.json"), "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b}, f)
+        for name in ("offsets", "doc_ids", "tfs", "doc_lens", "idf"):
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: str = "r") -> "BM25Index":
+        with open(os.path.join(path, "vocab.json"), encoding="utf-8") as f:
+            vocab = json.load(f)
+        with open(os.path.join(path, "params.json"), encoding="utf-8") as f:
+            params = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+                  for name in ("offsets", "doc_ids", "tfs", "doc_lens", "idf")}
+        return cls(vocab, **arrays, **params)
+
+    def get_top_k(self, query: str, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """Scores only documents present in the postings of the query terms. Returns (doc_ids, scores)."""
+        term_ids = [self.vocab[token] for token in tokenize(query) if token in self.vocab]
+        if not term_ids or k <= 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+
+        ids_parts, score_parts = [], []
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            ids = self.doc_ids[start:end]
+            tf = self.tfs[start:end].astype(np.float32)
+            norm = self.k1 * (1.0 - self.b + self.b * self.doc_lens[ids] / self.avgdl)
+            ids_parts.append(ids)
+            score_parts.append(self.idf[term_id] * tf * (self.k1 + 1.0) / (tf + norm))
+
+        docs, inverse = np.unique(np.concatenate(ids_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts)).astype(np.float32)
+
+        if len(docs) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(docs))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return docs[top], scores[top]
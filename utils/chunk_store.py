@@ -0,0 +1,123 @@
+import os
+import json
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+
+def format_doc_id(meta: Dict) -> str:
+    """Text description of a chunk source, the same string update_docs/update.py used to store as 'Meta'."""
+    return (" Parse date: " + meta.get('parse_date', 'date') + " Url: " + meta.get('current_url', 'url')
+            + " Section: " + meta.get('doc_section', 'doc') + " Header " + meta.get('h1_text', 'head'))
+
+
+class _View(Sequence):
+    def __init__(self, store: "ChunkStore", getter):
+        self.store = store
+        self.getter = getter
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.getter(j) for j in range(*i.indices(len(self)))]
+        # отрицательный id как у списка: offsets[-1] иначе дал бы пустой текст
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.getter(i)
+
+
+class ChunkStore:
+    """
+    All chunk texts in one UTF-8 blob addressed by an offsets array, plus page metadata stored once
+    per page and referenced by index. Saved as a directory and memory-mapped on load, so texts are
+    decoded only when a chunk id is requested and worker processes share the same pages.
+    Chunk ids are the dense index ids; removed chunks keep an empty text and page -1.
+    """
+
+    def __init__(self, offsets: np.ndarray, blob, page_ids: np.ndarray, pages: List[Dict]):
+        self.offsets = offsets
+        self.blob = blob
+        self.page_ids = page_ids
+        self.pages = pages
+
+    def __len__(self) -> int:
+        return len(self.page_ids)
+
+    @classmethod
+    def build(cls, texts: List[str], metas: List[Dict]) -> "ChunkStore":
+        encoded = [text.encode('utf-8') for text in texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(text) for text in encoded])
+
+        pages, page_index = [], {}
+        page_ids = np.full(len(metas), -1, dtype=np.int32)
+        for i, meta in enumerate(metas):
+            if not meta:
+                continue
+            key = json.dumps(meta, sort_keys=True, ensure_ascii=False)
+            if key not in page_index:
+                page_index[key] = len(pages)
+                pages.append(meta)
+            page_ids[i] = page_index[key]
+
+        return cls(offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8), page_ids, pages)
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "offsets.npy"), self.offsets)
+        np.save(os.path.join(path, "page_ids.npy"), self.page_ids)
+        with open(os.path.join(path, "blob.bin"), "wb") as f:
+            f.write(memoryview(self.blob))
+        with open(os.path.join(path, "pages.json"), "w", encoding="utf-8") as f:
+            json.dump(self.pages, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> "ChunkStore":
+        offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        page_ids = np.load(os.path.join(path, "page_ids.npy"), mmap_mode="r")
+        blob_path = os.path.join(path, "blob.bin")
+        # an empty file can not be memory-mapped
+        blob = np.memmap(blob_path, dtype=np.uint8, mode="r") if os.path.getsize(blob_path) else np.empty(0, np.uint8)
+        with open(os.path.join(path, "pages.json"), encoding="utf-8") as f:
+            pages = json.load(f)
+        return cls(offsets, blob, page_ids, pages)
+
+    def text(self, i: int) -> str:
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+
+    def meta(self, i: int) -> Dict:
+        page = self.page_ids[i]
+        return self.pages[page] if page >= 0 else {}
+
+    def doc_id(self, i: int) -> str:
+        return format_doc_id(self.meta(i))
+
+    @property
+    def texts(self) -> Sequence[str]:
+        """List-like lazy view: store.texts[i] decodes only chunk i."""
+        return _View(self, self.text)
+
+    @property
+    def metas(self) -> Sequence[Dict]:
+        return _View(self, self.meta)
+
+
+if __name__ == "__main__":
+    # перевод старых индексов (content_new.pkl + meta.pkl, bm_cp.pkl) в хранилище фрагментов и каталог
+    # постингов BM25 без пересчета эмбеддингов
+    import sys
+    import joblib
+    from utils.bm25 import BM25Index
+
+    index_dir = sys.argv[1] if len(sys.argv) > 1 else "./indexes"
+    store = ChunkStore.build(joblib.load(os.path.join(index_dir, "content_new.pkl")),
+                             joblib.load(os.path.join(index_dir, "meta.pkl")))
+    store.save(os.path.join(index_dir, "chunks"))
+    print(f"Saved {len(store)} chunks, {len(store.pages)} pages to {os.path.join(index_dir, 'chunks')}")
+    bm25 = BM25Index.build(joblib.load(os.path.join(index_dir, "bm_cp.pkl")))
+    bm25.save(os.path.join(index_dir, "bm_cp.bm25"))
+    print(f"Saved BM25 postings of {bm25.num_docs} chunks to {os.path.join(index_dir, 'bm_cp.bm25')}")
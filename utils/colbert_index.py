@@ -0,0 +1,134 @@
+import os
+import json
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+from tqdm import tqdm
+
+COLBERT_MODEL_NAME = "antoinelouis/colbert-xm"
+COLBERT_DTYPES = ("float16", "int8")
+
+
+class ColbertDocumentIndex:
+    """
+    Precomputed ColBERT token embeddings of every chunk: one (total_tokens, dim) matrix addressed by
+    an offsets array (row range of chunk i is offsets[i]:offsets[i + 1]). Stored as float16 or as int8
+    with one scale per token, memory-mapped on load. Removed chunks have no tokens.
+    """
+
+    def __init__(self, embeddings: np.ndarray, offsets: np.ndarray, scales: Optional[np.ndarray] = None):
+        self.embeddings = embeddings
+        self.offsets = offsets
+        self.scales = scales
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @staticmethod
+    def _compress(vectors: np.ndarray, dtype: str):
+        if dtype == "int8":
+            scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+            return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return vectors.astype(np.float16), None
+
+    def tokens(self, ids: List[int]) -> np.ndarray:
+        """float32 token embeddings of the given chunks, concatenated in order."""
+        parts = [np.asarray(self.embeddings[self.offsets[i]:self.offsets[i + 1]], dtype=np.float32) for i in ids]
+        vectors = np.concatenate(parts) if parts else np.empty((0, self.embeddings.shape[1]), dtype=np.float32)
+        if self.scales is not None:
+            vectors *= np.concatenate([self.scales[self.offsets[i]:self.offsets[i + 1]] for i in ids])[:, None]
+        return vectors
+
+    @classmethod
+    def build(cls, checkpoint, texts: List[str], dtype: str = "float16", batch_size: int = 64,
+              previous: Optional["ColbertDocumentIndex"] = None, reuse_ids: Optional[Set[int]] = None
+              ) -> "ColbertDocumentIndex":
+        """
+        Encodes chunk texts with a colbert Checkpoint (RAG.model.inference_ckpt). Texts are aligned with
+        dense index ids, empty texts get no tokens. Ids from reuse_ids copy their tokens from `previous`.
+        """
+        if dtype not in COLBERT_DTYPES:
+            raise ValueError(f"Unknown dtype {dtype!r}, expected one of {COLBERT_DTYPES}")
+        reuse_ids = reuse_ids or set()
+        chunks: Dict[int, np.ndarray] = {}
+        if previous is not None:
+            for i in reuse_ids:
+                chunks[i] = previous.tokens([i])
+
+        to_encode = [i for i, text in enumerate(texts) if text and i not in chunks]
+        for start in tqdm(range(0, len(to_encode), batch_size)):
+            batch_ids = to_encode[start:start + batch_size]
+            embeddings, doclens = checkpoint.docFromText([texts[i] for i in batch_ids], bsize=batch_size,
+                                                         keep_dims="flatten", to_cpu=True)
+            embeddings = embeddings.float().numpy()
+            bounds = np.concatenate([[0], np.cumsum(doclens)])
+            for j, i in enumerate(batch_ids):
+                chunks[i] = embeddings[bounds[j]:bounds[j + 1]]
+
+        dim = next(iter(chunks.values())).shape[1] if chunks else 0
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(chunks[i]) if i in chunks else 0 for i in range(len(texts))])
+        vectors = np.concatenate([chunks[i] for i in range(len(texts)) if i in chunks]) if chunks \
+            else np.empty((0, dim), dtype=np.float32)
+        embeddings, scales = cls._compress(vectors, dtype)
+        return cls(embeddings, offsets, scales)
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "embeddings.npy"), self.embeddings)
+        np.save(os.path.join(path, "offsets.npy"), self.offsets)
+        if self.scales is not None:
+            np.save(os.path.join(path, "scales.npy"), self.scales)
+        with open(os.path.join(path, "params.json"), "w") as f:
+            json.dump({"model": COLBERT_MODEL_NAME}, f)
+
+    @classmethod
+    def load(cls, path: str) -> "ColbertDocumentIndex":
+        scales_path = os.path.join(path, "scales.npy")
+        return cls(np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r"),
+                   np.load(os.path.join(path, "offsets.npy")),
+                   np.load(scales_path, mmap_mode="r") if os.path.exists(scales_path) else None)
+
+
+class ColbertReranker:
+    """
+    Late-interaction reranking by chunk id: only the query is encoded, documents are scored by
+    MaxSim against their precomputed token embeddings.
+    """
+
+    def __init__(self, RAG, doc_index: ColbertDocumentIndex):
+        self.RAG = RAG
+        self.checkpoint = RAG.model.inference_ckpt
+        self.doc_index = doc_index
+
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        return self.checkpoint.queryFromText(queries, to_cpu=True).float().numpy()
+
+    def score(self, query_embedding: np.ndarray, ids: List[int]) -> np.ndarray:
+        """MaxSim: for every query token the best matching document token, summed over query tokens."""
+        lengths = np.array([self.doc_index.offsets[i + 1] - self.doc_index.offsets[i] for i in ids])
+        scores = np.zeros(len(ids), dtype=np.float32)
+        present = lengths > 0
+        if not present.any():
+            return scores
+        similarities = query_embedding @ self.doc_index.tokens([i for i, p in zip(ids, present) if p]).T
+        starts = np.concatenate([[0], np.cumsum(lengths[present])[:-1]])
+        scores[present] = np.maximum.reduceat(similarities, starts, axis=1).sum(axis=0)
+        return scores
+
+    def _ranked(self, ids: List[int], scores: np.ndarray, k: int) -> List[Dict]:
+        order = np.argsort(-scores, kind="stable")[:k]
+        return [{'index': ids[j], 'score': float(scores[j]), 'rank': rank}
+                for rank, j in enumerate(order, start=1)]
+
+    def rerank_ids(self, query: str, ids: List[int], k: int = 5) -> List[Dict]:
+        query_embedding = self.encode_queries([query])[0]
+        return self._ranked(ids, self.score(query_embedding, ids), k)
+
+    def rerank_ids_batch(self, queries: List[str], ids: List[List[int]], k: int = 5) -> List[List[Dict]]:
+        """Encodes all queries in one call, then scores each query's own candidates."""
+        if not queries:
+            return []
+        query_embeddings = self.encode_queries(queries)
+        return [self._ranked(candidate_ids, self.score(query_embedding, candidate_ids), k)
+                for query_embedding, candidate_ids in zip(query_embeddings, ids)]
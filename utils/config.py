@@ -1,4 +1,6 @@
-from dataclasses import dataclass
+import os
+from typing import Dict
+from dataclasses import dataclass, field
 
 @dataclass
 class GenerationConfig:
@@ -16,3 +18,152 @@ class GenerationConfig:
         Вопрос: Можно ли и откуда доставать данные гендера и возраста человека, скачавшего приложение? Необходимо для более точной настройки таргета РСЯ
         Ответ: Недостаточно информации, перевожу на оператора.
     """
+
+
+@dataclass
+class RetrievalConfig:
+    # "dense" - только векторный поиск, "rrf" - reciprocal rank fusion, "weighted" - взвешенная сумма нормированных скоров
+    fusion: str = "dense"
+    rrf_k: int = 60
+    dense_weight: float = 0.7
+    # "voyager" - HNSW, "numpy" - точный поиск по матрице, "auto" - выбор по размеру корпуса (utils/dense.py)
+    dense_backend: str = "auto"
+    # хранение векторов: numpy - "float32", "float16", "int8"; voyager - "float32", "e4m3", "float8"
+    storage_dtype: str = "float32"
+    # > 0 - квантизованный индекс пересчитывает top k * rescore_oversample кандидатов по float32 векторам
+    rescore_oversample: int = 0
+    # "torch" - SentenceTransformer, "onnx" - экспорт в ONNX и onnxruntime на CPU (utils/onnx_embedder.py)
+    embedder_backend: str = "torch"
+    onnx_dir: str = "./indexes/onnx_e5"
+    onnx_quantize: bool = True
+
+
+@dataclass
+class RerankCascadeConfig:
+    # выключено по умолчанию, пока пороги не подобраны по логам запросов
+    enabled: bool = False
+    # глубина кандидатов: обычная и расширенная, когда скоры почти не различаются
+    base_k: int = 20
+    max_k: int = 50
+    # пороги заданы для каждого режима RetrievalConfig.fusion, у режимов своя шкала скора первого этапа:
+    # dense - косинусное сходство, rrf - сумма 1 / (rrf_k + rank) по двум спискам (не больше 2 / (rrf_k + 1),
+    # ~0.033 при rrf_k=60), weighted - взвешенная сумма скоров, нормированных в [0, 1]
+    # top1 - top2 >= skip_margin: реранкер не вызывается, берется порядок первого этапа;
+    # для rrf это, например, top1 первый в обоих списках, а top2 высоко только в одном из них
+    skip_margin: Dict[str, float] = field(default_factory=lambda: {"dense": 0.05, "rrf": 0.008, "weighted": 0.15})
+    # top1 - top2 >= shrink_margin: реранжируются только первые shrink_k кандидатов
+    shrink_margin: Dict[str, float] = field(default_factory=lambda: {"dense": 0.02, "rrf": 0.002, "weighted": 0.06})
+    shrink_k: int = 8
+    # top1 - top(flat_window) <= flat_spread: скоры "плоские", реранжируются все max_k кандидатов
+    flat_window: int = 10
+    flat_spread: Dict[str, float] = field(default_factory=lambda: {"dense": 0.01, "rrf": 0.001, "weighted": 0.03})
+
+
+@dataclass
+class AnswerCacheConfig:
+    # выключено по умолчанию, пока порог не подобран: короткие шаблонные вопросы ("как удалить / как установить
+    # приложение") дают высокое сходство E5, и ложное попадание отдает ответ на чужой вопрос
+    enabled: bool = False
+    # в выключенном состоянии кэш работает в теневом режиме: ответы не отдаются, в лог (INFO) пишутся
+    # log_top ближайших закэшированных запросов со сходством - по ним подбирается threshold
+    shadow: bool = True
+    log_top: int = 3
+    # минимальное косинусное сходство эмбеддингов запросов для повторного использования ответа (не откалиброван)
+    threshold: float = 0.95
+    ttl_seconds: float = 3600
+    max_entries: int = 1000
+    # файл с версией индекса, пишется update_indexes; при смене версии кэш очищается
+    version_path: str = "./indexes/version.txt"
+
+
+@dataclass
+class VllmSchedulerConfig:
+    # максимальное число последовательностей в одном шаге continuous batching vLLM
+    max_num_seqs: int = 32
+    gpu_memory_utilization: float = 0.9
+    # автоматическое кэширование KV префикса: системный промпт с примерами не пересчитывается (vLLM >= 0.4)
+    enable_prefix_caching: bool = True
+    # как часто снимаются метрики очереди и размера батча, и сколько последних замеров хранится
+    metrics_interval_seconds: float = 0.1
+    metrics_window: int = 600
+    # период записи метрик в лог, пока движок занят
+    log_interval_seconds: float = 30
+
+
+@dataclass
+class ContextConfig:
+    # токены контекста считаются токенизатором генеративной модели
+    tokenizer_name: str = "mistralai/Mistral-7B-Instruct-v0.2"
+    max_context_tokens: int = 1500
+    max_passages: int = 6
+    # сколько фрагментов после реранжирования претендуют на место в контексте
+    rerank_k: int = 8
+    # минимальная длина общего куска соседних фрагментов страницы для склейки
+    min_overlap_chars: int = 20
+    # предложения не короче этого, уже присутствующие в контексте, удаляются
+    min_span_chars: int = 40
+
+
+@dataclass
+class GigaChatConfig:
+    # ключ авторизации (Basic), по умолчанию из переменной окружения GIGACHAT_CREDENTIALS
+    credentials: str = field(default_factory=lambda: os.environ.get("GIGACHAT_CREDENTIALS", ""))
+    scope: str = "GIGACHAT_API_PERS"
+    model: str = "GigaChat-Pro"
+    auth_url: str = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
+    base_url: str = "https://gigachat.devices.sberbank.ru/api/v1"
+    verify_ssl: bool = False
+    ca_bundle: str = ""
+    max_connections: int = 32
+    # одновременных запросов к API не больше max_concurrency, остальные ждут слот
+    max_concurrency: int = 8
+    # общий дедлайн запроса вместе с повторами
+    timeout_seconds: float = 60
+    max_retries: int = 3
+    # пауза перед повтором: случайная от 0 до min(backoff_max, backoff_base * 2^attempt)
+    backoff_base: float = 0.5
+    backoff_max: float = 8
+    # токен обновляется заранее, за столько секунд до истечения
+    token_refresh_margin: float = 60
+
+
+@dataclass
+class HedgingConfig:
+    # режим "самый быстрый ответ": вместо двух ответов показывается первый готовый
+    enabled: bool = False
+    primary: str = "GigaChat"
+    secondary: str = "Mistral"
+    # запасной запрос отправляется, когда основной дольше этого перцентиля своих задержек
+    percentile: float = 0.9
+    # пока ответов меньше min_samples, задержка равна default_delay_seconds
+    min_samples: int = 20
+    default_delay_seconds: float = 8.0
+    min_delay_seconds: float = 1.0
+    window: int = 500
+
+
+@dataclass
+class LocalModelConfig:
+    # "vllm" - Mistral на GPU, "llama_cpp" - квантизованный GGUF на CPU (узлы без GPU, стенды)
+    backend: str = "vllm"
+    model_path: str = "mistralai/Mistral-7B-Instruct-v0.2"
+    gguf_path: str = "./models/mistral-7b-instruct-v0.2.Q4_K_M.gguf"
+    # если файла нет, он скачивается с Hugging Face
+    gguf_repo_id: str = "TheBloke/Mistral-7B-Instruct-v0.2-GGUF"
+    gguf_filename: str = "mistral-7b-instruct-v0.2.Q4_K_M.gguf"
+    # 0 - все ядра
+    n_threads: int = 0
+    n_ctx: int = 4096
+
+
+@dataclass
+class ServingConfig:
+    # адрес HTTP API (api.py); если пустой, Streamlit сам загружает модели
+    api_url: str = field(default_factory=lambda: os.environ.get("RUSTORE_API_URL", ""))
+    # одновременных запросов к поиску/реранкеру и к генерации, остальные ждут в очереди
+    max_concurrent_retrievals: int = 4
+    max_concurrent_generations: int = 16
+    # сколько запрос может ждать свободного слота, затем 503
+    queue_timeout_seconds: float = 30
+    # таймаут клиента на весь ответ
+    request_timeout_seconds: float = 300
@@ -0,0 +1,137 @@
+import re
+from functools import lru_cache
+from typing import Callable, Dict, List, Sequence
+
+from utils.config import ContextConfig
+
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+|\n+')
+
+
+@lru_cache(maxsize=None)
+def load_tokenizer(name: str):
+    from transformers import AutoTokenizer
+
+    return AutoTokenizer.from_pretrained(name)
+
+
+def token_counter(name: str) -> Callable[[str], int]:
+    tokenizer = load_tokenizer(name)
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def format_passage(text: str, meta: Dict) -> str:
+    """How a passage is written into the prompt, also what its token cost is measured on."""
+    return f"'{text}. Ссылка: {meta.get('current_url', '-')}',"
+
+
+def overlap(left: str, right: str, min_chars: int) -> int:
+    """Length of the longest suffix of `left` that is a prefix of `right`, 0 if shorter than min_chars."""
+    if len(left) < min_chars or len(right) < min_chars:
+        return 0
+    probe = right[:min_chars]
+    start = left.find(probe)
+    while start != -1:
+        if right.startswith(left[start:]):
+            return len(left) - start
+        start = left.find(probe, start + 1)
+    return 0
+
+
+def _strip_header(text: str, meta: Dict) -> str:
+    # тексты фрагментов начинаются с заголовка страницы (Header + ' ' + Content), при склейке он не повторяется
+    header = meta.get('h1_text', '')
+    return text[len(header) + 1:] if header and text.startswith(header + ' ') else text
+
+
+class _Passage:
+    def __init__(self, chunk_id: int, text: str, meta: Dict):
+        self.ids = [int(chunk_id)]
+        self.text = text
+        self.meta = meta
+
+    def url(self):
+        return self.meta.get('current_url')
+
+    def merged(self, chunk_id: int, text: str, min_chars: int):
+        """Text of the passage joined with a chunk of the same page, None if they are not neighbours."""
+        if text in self.text:
+            return self.text
+        if self.text in text:
+            return text
+        body = _strip_header(text, self.meta)
+        if chunk_id > max(self.ids):
+            size = overlap(self.text, body, min_chars)
+            if size or chunk_id == max(self.ids) + 1:
+                return self.text + (body[size:] if size else '\n' + body)
+        if chunk_id < min(self.ids):
+            own_body = _strip_header(self.text, self.meta)
+            size = overlap(text, own_body, min_chars)
+            if size or chunk_id == min(self.ids) - 1:
+                return text + (own_body[size:] if size else '\n' + own_body)
+        return None
+
+
+def _drop_seen_spans(text: str, passages: List[_Passage], min_chars: int) -> str:
+    """Removes sentences that are already present in the selected passages."""
+    sentences = [s for s in _SENTENCE_SPLIT.split(text) if s]
+    kept = [s for s in sentences
+            if len(s) < min_chars or not any(s in passage.text for passage in passages)]
+    return text if len(kept) == len(sentences) else ' '.join(kept)
+
+
+def _truncate(text: str, meta: Dict, budget: int, count_tokens: Callable[[str], int]) -> str:
+    tokens = count_tokens(format_passage(text, meta))
+    while tokens > budget and text:
+        text = text[:int(len(text) * budget / tokens * 0.95)]
+        tokens = count_tokens(format_passage(text, meta))
+    return text
+
+
+def pack_context(indexes: Sequence[int], content_old, meta, count_tokens: Callable[[str], int],
+                 config: ContextConfig = None) -> List[Dict]:
+    """
+    Fills the token budget with reranked chunks in rank order. A chunk of a page that is already selected
+    is merged into its passage when the two are adjacent or overlap (split_documents keeps 10% overlap),
+    chunks contained in a passage and sentences already in the context are dropped.
+    Returns passages as {"page_content", "metadata", "ids"}; the first one is truncated if it alone
+    exceeds the budget.
+    """
+    config = config or ContextConfig()
+    passages: List[_Passage] = []
+    costs: List[int] = []
+    for chunk_id in indexes:
+        if chunk_id is None:
+            continue
+        text, chunk_meta = content_old[chunk_id], meta[chunk_id]
+        if not text:
+            continue
+        used = sum(costs)
+
+        merged = False
+        for n, passage in enumerate(passages):
+            if passage.url() != chunk_meta.get('current_url'):
+                continue
+            joined = passage.merged(chunk_id, text, config.min_overlap_chars)
+            if joined is None:
+                continue
+            merged = True
+            cost = count_tokens(format_passage(joined, passage.meta))
+            if used - costs[n] + cost <= config.max_context_tokens:
+                passage.text = joined
+                passage.ids = sorted(passage.ids + [int(chunk_id)])
+                costs[n] = cost
+            break
+        if merged:
+            continue
+
+        text = _drop_seen_spans(text, passages, config.min_span_chars)
+        cost = count_tokens(format_passage(text, chunk_meta))
+        if not passages and cost > config.max_context_tokens:
+            text = _truncate(text, chunk_meta, config.max_context_tokens, count_tokens)
+            cost = count_tokens(format_passage(text, chunk_meta))
+        if used + cost > config.max_context_tokens or len(passages) >= config.max_passages:
+            continue
+        passages.append(_Passage(chunk_id, text, chunk_meta))
+        costs.append(cost)
+
+    return [{"page_content": passage.text, "metadata": passage.meta, "ids": passage.ids} for passage in passages]
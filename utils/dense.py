@@ -0,0 +1,329 @@
+import os
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+from voyager import Index, Space, StorageDataType
+
+DENSE_BACKENDS = ("voyager", "numpy", "auto")
+
+# форматы хранения векторов для каждого backend
+STORAGE_DTYPES = {
+    "numpy": {"float32": np.float32, "float16": np.float16, "int8": np.int8},
+    "voyager": {"float32": StorageDataType.Float32, "e4m3": StorageDataType.E4M3, "float8": StorageDataType.Float8},
+}
+
+# Граница переключения для backend="auto": до этого числа фрагментов точный поиск укладывается в 5 мс на запрос
+# (на фоне ~100 мс на эмбеддинг запроса) и дает полный recall. Замер `python -m utils.dense`, 1 ядро, float32, k=20:
+# 5k - 2.4 мс, 10k - 6.4 мс (HNSW 0.5-0.7 мс при recall@20 0.6-0.77). Пересчитывать на целевом железе там же.
+EXACT_SEARCH_MAX_DOCS = 8_000
+
+
+class NumpyIndex:
+    """
+    Exact cosine search over a contiguous matrix of normalized vectors.
+    Mirrors the parts of voyager.Index used by the pipeline: add_item(s), mark_deleted, query, save, load.
+    dtype=int8 stores each vector scaled to [-127, 127] with its own float32 scale.
+    """
+
+    def __init__(self, num_dimensions: int, dtype=np.float32):
+        self.num_dimensions = num_dimensions
+        self.dtype = np.dtype(dtype)
+        self.vectors = np.empty((0, num_dimensions), dtype=self.dtype)
+        self.scales = np.empty(0, dtype=np.float32)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.deleted = np.empty(0, dtype=bool)
+
+    def __len__(self) -> int:
+        return int(len(self.ids) - self.deleted.sum())
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def add_items(self, vectors, ids: Optional[List[int]] = None, num_threads: int = -1) -> List[int]:
+        vectors = self._normalize(np.atleast_2d(vectors))
+        if self.dtype == np.int8:
+            scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+            vectors = np.round(vectors / scales[:, None]).astype(np.int8)
+            self.scales = np.concatenate([self.scales, scales.astype(np.float32)])
+        else:
+            vectors = vectors.astype(self.dtype)
+        if ids is None:
+            start = int(self.ids.max()) + 1 if len(self.ids) else 0
+            ids = np.arange(start, start + len(vectors))
+        ids = np.asarray(ids, dtype=np.int64)
+        self.vectors = np.ascontiguousarray(np.concatenate([self.vectors, vectors]))
+        self.ids = np.concatenate([self.ids, ids])
+        self.deleted = np.concatenate([self.deleted, np.zeros(len(ids), dtype=bool)])
+        return ids.tolist()
+
+    def add_item(self, vector, id: Optional[int] = None) -> int:
+        return self.add_items([vector], ids=None if id is None else [id])[0]
+
+    def mark_deleted(self, id: int) -> None:
+        rows = np.flatnonzero(self.ids == id)
+        if not len(rows):
+            raise KeyError(id)
+        self.deleted = np.array(self.deleted)  # loaded arrays are read-only memory maps
+        self.deleted[rows] = True
+
+    def _scores(self, queries: np.ndarray, block_size: int = 8192) -> np.ndarray:
+        if self.vectors.dtype == np.float32:
+            return queries @ self.vectors.T
+        # float16 and int8 have no BLAS path, so the matrix is upcast block by block
+        scores = np.concatenate([queries @ self.vectors[i:i + block_size].astype(np.float32).T
+                                 for i in range(0, len(self.vectors), block_size)], axis=1)
+        if self.vectors.dtype == np.int8:
+            scores *= self.scales
+        return scores
+
+    def query(self, vectors, k: int = 1, num_threads: int = -1) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (ids, cosine distances) like voyager: 1D arrays for one vector, 2D for a batch."""
+        single = np.ndim(vectors) == 1
+        queries = self._normalize(np.atleast_2d(vectors))
+        scores = self._scores(queries)
+        if self.deleted.any():
+            scores[:, self.deleted] = -np.inf
+
+        k = min(k, len(self))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k] if k < scores.shape[1] else np.argsort(-scores, axis=1)
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)[:, :k]
+        ids = self.ids[top]
+        distances = 1.0 - np.take_along_axis(scores, top, axis=1)
+        return (ids[0], distances[0]) if single else (ids, distances)
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "vectors.npy"), self.vectors)
+        np.save(os.path.join(path, "scales.npy"), self.scales)
+        np.save(os.path.join(path, "ids.npy"), self.ids)
+        np.save(os.path.join(path, "deleted.npy"), self.deleted)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: str = "r") -> "NumpyIndex":
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode=mmap_mode)
+        index = cls(vectors.shape[1], dtype=vectors.dtype)
+        index.vectors = vectors
+        scales_path = os.path.join(path, "scales.npy")
+        if os.path.exists(scales_path):
+            index.scales = np.load(scales_path)
+        index.ids = np.load(os.path.join(path, "ids.npy"))
+        index.deleted = np.load(os.path.join(path, "deleted.npy"))
+        return index
+
+
+class RescoringIndex:
+    """
+    Wraps a quantized index and re-ranks its top k * oversample candidates by exact cosine similarity.
+    Full precision vectors live in a separate matrix (row = id), memory-mapped on load,
+    so only the rows of the candidates are read from disk. Rows of deleted and never added ids are zero.
+    """
+
+    def __init__(self, index, vectors: Optional[np.ndarray] = None, oversample: int = 4):
+        self.index = index
+        self.vectors = vectors if vectors is not None else np.empty((0, index.num_dimensions), dtype=np.float32)
+        self.oversample = oversample
+        self._live = None
+
+    @property
+    def num_dimensions(self) -> int:
+        return self.index.num_dimensions
+
+    def __len__(self) -> int:
+        # len(voyager.Index) считает и удаленные элементы, поэтому живые считаются по ненулевым строкам
+        # float32 матрицы, один раз после загрузки и изменений
+        if self._live is None:
+            self._live = sum(int(np.count_nonzero(np.any(self.vectors[i:i + 8192] != 0, axis=1)))
+                             for i in range(0, len(self.vectors), 8192))
+        return self._live
+
+    def add_items(self, vectors, ids: Optional[List[int]] = None, num_threads: int = -1) -> List[int]:
+        vectors = NumpyIndex._normalize(np.atleast_2d(vectors))
+        ids = self.index.add_items(vectors, ids=ids)
+        size = max(max(ids) + 1, len(self.vectors))
+        if size > len(self.vectors):
+            grown = np.zeros((size, vectors.shape[1]), dtype=np.float32)
+            grown[:len(self.vectors)] = self.vectors
+            self.vectors = grown
+        self.vectors[ids] = vectors
+        self._live = None
+        return list(ids)
+
+    def add_item(self, vector, id: Optional[int] = None) -> int:
+        return self.add_items([vector], ids=None if id is None else [id])[0]
+
+    def mark_deleted(self, id: int) -> None:
+        self.index.mark_deleted(id)
+        if not self.vectors.flags.writeable:
+            self.vectors = np.array(self.vectors)  # loaded vectors are a read-only memory map
+        self.vectors[id] = 0
+        self._live = None
+
+    def query(self, vectors, k: int = 1, num_threads: int = -1) -> Tuple[np.ndarray, np.ndarray]:
+        single = np.ndim(vectors) == 1
+        queries = NumpyIndex._normalize(np.atleast_2d(vectors))
+        # как NumpyIndex: k не больше числа живых элементов, иначе voyager падает с "Fewer than expected results"
+        k = min(k, len(self))
+        if k == 0:
+            ids, distances = np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0), np.float32)
+            return (ids[0], distances[0]) if single else (ids, distances)
+        candidates = self._candidates(queries, min(k * self.oversample, len(self)), k, num_threads)
+        scores = np.einsum("qd,qcd->qc", queries, self.vectors[candidates])
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        ids = np.take_along_axis(candidates, order, axis=1)
+        distances = 1.0 - np.take_along_axis(scores, order, axis=1)
+        return (ids[0], distances[0]) if single else (ids, distances)
+
+    def _candidates(self, queries: np.ndarray, size: int, k: int, num_threads: int) -> np.ndarray:
+        # HNSW с удаленными узлами может найти меньше кандидатов, чем живых элементов:
+        # тогда число кандидатов уменьшается до k
+        while True:
+            try:
+                return self.index.query(queries, k=size, num_threads=num_threads)[0]
+            except RuntimeError:
+                if size <= k:
+                    raise
+                size = max(k, size // 2)
+
+    @staticmethod
+    def vectors_path(path: str) -> str:
+        return path.rstrip("/") + ".fp32.npy"
+
+    def save(self, path: str) -> None:
+        self.index.save(path)
+        np.save(self.vectors_path(path), self.vectors)
+
+
+def create_index(backend: str, num_dimensions: int, num_docs: Optional[int] = None,
+                 storage_dtype: str = "float32", rescore_oversample: int = 0):
+    """
+    Creates an empty dense index. backend="auto" picks exact search for corpora up to EXACT_SEARCH_MAX_DOCS.
+    storage_dtype is one of STORAGE_DTYPES[backend]; with rescore_oversample > 0 a quantized index
+    keeps full precision vectors on the side for re-ranking its candidates.
+    """
+    if backend not in DENSE_BACKENDS:
+        raise ValueError(f"Unknown dense backend {backend!r}, expected one of {DENSE_BACKENDS}")
+    if backend == "auto":
+        backend = "numpy" if num_docs is not None and num_docs <= EXACT_SEARCH_MAX_DOCS else "voyager"
+    if storage_dtype not in STORAGE_DTYPES[backend]:
+        raise ValueError(f"Storage dtype {storage_dtype!r} is not supported by {backend}, "
+                         f"expected one of {tuple(STORAGE_DTYPES[backend])}")
+
+    dtype = STORAGE_DTYPES[backend][storage_dtype]
+    if backend == "numpy":
+        index = NumpyIndex(num_dimensions, dtype=dtype)
+    else:
+        index = Index(Space.Cosine, num_dimensions=num_dimensions, storage_data_type=dtype)
+
+    if rescore_oversample > 0 and storage_dtype != "float32":
+        return RescoringIndex(index, oversample=rescore_oversample)
+    return index
+
+
+def load_index(path: str, rescore_oversample: int = 0):
+    """
+    Loads an index saved by either backend: NumpyIndex saves a directory, voyager a single file.
+    If full precision vectors were saved next to it and rescore_oversample > 0, the index is wrapped
+    into a RescoringIndex.
+    """
+    index = NumpyIndex.load(path) if os.path.isdir(path) else Index.load(path)
+    vectors_path = RescoringIndex.vectors_path(path)
+    if rescore_oversample > 0 and os.path.exists(vectors_path):
+        return RescoringIndex(index, np.load(vectors_path, mmap_mode="r"), oversample=rescore_oversample)
+    return index
+
+
+def recall_at_k(ids: np.ndarray, exact_ids: np.ndarray) -> float:
+    """Mean share of the exact top-k found in the approximate top-k."""
+    k = exact_ids.shape[1]
+    return float(np.mean([len(set(a) & set(b)) / k for a, b in zip(ids.tolist(), exact_ids.tolist())]))
+
+
+def index_memory(index) -> int:
+    """Bytes taken by the vectors of a NumpyIndex (the voyager size is read from its saved file)."""
+    if isinstance(index, RescoringIndex):
+        index = index.index
+    if isinstance(index, NumpyIndex):
+        return index.vectors.nbytes + index.scales.nbytes
+    return len(index.as_bytes())
+
+
+def benchmark_backends(sizes=(1_000, 2_000, 5_000, 10_000, 20_000), num_dimensions: int = 1024,
+                       num_queries: int = 200, k: int = 20, latency_budget_ms: float = 5.0,
+                       dtype=np.float32, seed: int = 42) -> Optional[int]:
+    """
+    Prints per-query latency of both backends and HNSW recall@k against exact search.
+    Returns the largest corpus size for which exact search fits latency_budget_ms per query:
+    below it exact search costs nothing noticeable next to query embedding and gives perfect recall.
+    Random vectors are the worst case for HNSW recall, real embeddings are more clustered.
+    """
+    rng = np.random.default_rng(seed)
+    switch_point = None
+    print(f"{'docs':>8} {'numpy ms':>9} {'numpy batch ms':>15} {'voyager ms':>11} {'voyager batch ms':>17} {'recall':>7}")
+    for size in sizes:
+        vectors = rng.standard_normal((size, num_dimensions), dtype=np.float32)
+        queries = vectors[rng.choice(size, num_queries)] + 0.1 * rng.standard_normal((num_queries, num_dimensions),
+                                                                                    dtype=np.float32)
+        exact = NumpyIndex(num_dimensions, dtype=dtype)
+        exact.add_items(vectors)
+        hnsw = Index(Space.Cosine, num_dimensions=num_dimensions)
+        hnsw.add_items(vectors)
+
+        timings = []
+        for index in (exact, hnsw):
+            start = time.perf_counter()
+            for query in queries:
+                index.query(query, k=k)
+            single = (time.perf_counter() - start) / num_queries * 1000
+            start = time.perf_counter()
+            ids, _ = index.query(queries, k=k)
+            batch = (time.perf_counter() - start) / num_queries * 1000
+            timings.append((single, batch, ids))
+
+        (np_single, np_batch, exact_ids), (hn_single, hn_batch, hnsw_ids) = timings
+        recall = recall_at_k(hnsw_ids, exact_ids)
+        print(f"{size:>8} {np_single:>9.3f} {np_batch:>15.3f} {hn_single:>11.3f} {hn_batch:>17.3f} {recall:>7.3f}")
+        if np_single <= latency_budget_ms:
+            switch_point = size
+
+    print(f"exact search fits {latency_budget_ms} ms per query up to {switch_point} docs")
+    return switch_point
+
+
+def benchmark_quantization(vectors: Optional[np.ndarray] = None, num_docs: int = 5_000, num_dimensions: int = 1024,
+                           num_queries: int = 200, k: int = 20, oversample: int = 4, seed: int = 42) -> None:
+    """
+    Prints memory and recall@k against exact float32 search for every storage dtype, with and without rescoring.
+    Pass real document embeddings as `vectors` to measure on the corpus instead of random vectors.
+    """
+    rng = np.random.default_rng(seed)
+    if vectors is None:
+        vectors = rng.standard_normal((num_docs, num_dimensions), dtype=np.float32)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    queries = vectors[rng.choice(len(vectors), num_queries)]
+    queries = queries + 0.1 * np.linalg.norm(queries, axis=1, keepdims=True) / np.sqrt(vectors.shape[1]) \
+        * rng.standard_normal(queries.shape, dtype=np.float32)
+
+    reference = create_index("numpy", vectors.shape[1])
+    reference.add_items(vectors)
+    exact_ids, _ = reference.query(queries, k=k)
+
+    print(f"{'backend':>8} {'dtype':>8} {'MB':>8} {'recall':>7} {'rescored':>9}")
+    for backend, dtypes in STORAGE_DTYPES.items():
+        for storage_dtype in dtypes:
+            index = create_index(backend, vectors.shape[1], storage_dtype=storage_dtype, rescore_oversample=oversample)
+            index.add_items(vectors)
+            inner = index.index if isinstance(index, RescoringIndex) else index
+            recall = recall_at_k(inner.query(queries, k=k)[0], exact_ids)
+            rescored = recall_at_k(index.query(queries, k=k)[0], exact_ids) if inner is not index else recall
+            print(f"{backend:>8} {storage_dtype:>8} {index_memory(inner) / 2 ** 20:>8.1f} {recall:>7.3f} {rescored:>9.3f}")
+
+
+if __name__ == "__main__":
+    benchmark_backends()
+    benchmark_quantization()
@@ -1,13 +1,15 @@
 # vllm
 import os
-from vllm import LLM, SamplingParams
+import time
+import threading
 from abc import ABC, abstractmethod
-from langchain.schema import HumanMessage, SystemMessage
-from langchain.chat_models.gigachat import GigaChat
+from utils.config import VllmSchedulerConfig, GigaChatConfig
+from utils.giga_client import GigaChatClient
 
 def get_os():
-    os.environ["CUDA_DEVICE_ORDER"] = "PCI_BUS_ID"
-    os.environ["CUDA_VISIBLE_DEVICES"] = "2, 3"
+    # заданные снаружи устройства не переопределяются
+    os.environ.setdefault("CUDA_DEVICE_ORDER", "PCI_BUS_ID")
+    os.environ.setdefault("CUDA_VISIBLE_DEVICES", "2, 3")
 
     DEVICE_MAP = 'auto'
 
@@ -26,6 +28,14 @@ class GenerativeModel(ABC):
                   text):
         pass
 
+    def inference_batch(self, texts, **kwargs):
+        """Generate answers for several inputs. Backends that can batch override this."""
+        return [self.inference(text, **kwargs) for text in texts]
+
+    def inference_stream(self, text, **kwargs):
+        """Generate text in pieces as it is produced. Backends that can stream override this."""
+        yield self.inference(text, **kwargs)
+
     @abstractmethod
     def load(self):
         pass
@@ -36,36 +46,71 @@ class GenerativeModel(ABC):
 
 
 
-class Mistral(GenerativeModel):
+class VllmModel(GenerativeModel):
+    """Local model served by vLLM's async engine; subclasses define the prompt format."""
+
     def __init__(self, model_name, model_path, system_prompt=''):
         super().__init__(model_name, system_prompt)
         self.model_path = model_path
-        self.load() 
+        self.config_prompt(system_prompt)
+        self.load()
 
     def load(self):
-        self.model = LLM(model=self.model_path, 
-                  trust_remote_code=True, 
-                  seed=42)
+        # vllm импортируется только здесь: на CPU-узлах без него работают GigaApi и LlamaCpp
+        from utils.vllm_engine import AsyncEngineRunner
+
+        config = VllmSchedulerConfig()
+        self.model = AsyncEngineRunner(self.model_path,
+                                       max_num_seqs=config.max_num_seqs,
+                                       gpu_memory_utilization=config.gpu_memory_utilization,
+                                       metrics_interval_seconds=config.metrics_interval_seconds,
+                                       metrics_window=config.metrics_window,
+                                       log_interval_seconds=config.log_interval_seconds,
+                                       enable_prefix_caching=config.enable_prefix_caching)
+
+    def metrics(self):
+        """Queue depth and batch size of the shared engine"""
+        return self.model.metrics()
 
-    def config_prompt(self, system_prompt):
-        """Configure or update the system prompt."""
-        self.system_prompt = "<s>[INST] " + system_prompt
-        
+    @abstractmethod
+    def build_prompt(self, text):
+        """The formatted system prompt must come first and unchanged, so that its KV cache is reused."""
+        pass
+
+    @staticmethod
+    def sampling_params(top_p=0.6, temperature=0.8, repetition_penalty=1.0, max_new_tokens=2000):
+        from vllm import SamplingParams
+
+        return SamplingParams(top_p=top_p, temperature=temperature, repetition_penalty=repetition_penalty,
+                              max_tokens=max_new_tokens)
 
     def inference(self, text, top_p=0.6, temperature=0.8, repetition_penalty=1.0, max_new_tokens=2000,
                   skip_special_tokens=False):
         """Generate text based on the provided input"""
-        sampling_params = SamplingParams(top_p=top_p, temperature=temperature, repetition_penalty=repetition_penalty,
-                                         max_tokens=max_new_tokens)
-        
-        prompt = self.system_prompt + '\n' + text + ' [/INST] '
-        
-        output = self.model.generate(prompt, sampling_params)
-        
-        prompt = output[0].prompt
-        generated_text = output[0].outputs[0].text
+        return ''.join(self.inference_stream(text, top_p, temperature, repetition_penalty, max_new_tokens))
+
+    def inference_stream(self, text, top_p=0.6, temperature=0.8, repetition_penalty=1.0, max_new_tokens=2000,
+                         skip_special_tokens=False):
+        """Generate text based on the provided input, yielding it in pieces as tokens are decoded"""
+        sampling_params = self.sampling_params(top_p, temperature, repetition_penalty, max_new_tokens)
+        return self.model.stream(self.build_prompt(text), sampling_params)
+
+    def inference_batch(self, texts, top_p=0.6, temperature=0.8, repetition_penalty=1.0, max_new_tokens=2000,
+                        skip_special_tokens=False):
+        """Generate answers for all inputs, submitted to the engine together"""
+        sampling_params = self.sampling_params(top_p, temperature, repetition_penalty, max_new_tokens)
+        return self.model.generate([self.build_prompt(text) for text in texts], sampling_params)
+
+
+
+class Mistral(VllmModel):
+    def config_prompt(self, system_prompt):
+        """Configure or update the system prompt."""
+        self.system_prompt = "<s>[INST] " + system_prompt
         
-        return generated_text
+
+    def build_prompt(self, text):
+        return self.system_prompt + '\n' + text + ' [/INST] '
 
 
 
@@ -73,18 +118,20 @@ class GigaApi(GenerativeModel):
     def __init__(self,
                  model_name,
                  system_prompt='',
-                 credentials = ''):
+                 credentials = '',
+                 config=None):
         
         super().__init__(model_name, system_prompt)
-        self.credentials = credentials
-        self.messages = []
+        self.config = config or GigaChatConfig()
+        if credentials:
+            self.config.credentials = credentials
         self.chat = None
         self.load()
 
         
     def load(self):
-        """Load the model and tokenizer."""
-        self.chat = GigaChat(model="GigaChat-Pro", credentials=self.credentials, verify_ssl_certs=False)
+        """Create the pooled API client."""
+        self.chat = GigaChatClient(self.config)
 
 
     def config_prompt(self, system_prompt):
@@ -92,48 +139,114 @@ class GigaApi(GenerativeModel):
         self.system_prompt = system_prompt
         
         
+    def build_messages(self, text):
+        return [{"role": "system", "content": self.system_prompt}, {"role": "user", "content": text}]
 
     def inference(self,
                   text):
         """Generate text based on the provided input"""
+        return self.chat.chat(self.build_messages(text))
+
+    def inference_stream(self, text):
+        """Generate text based on the provided input, yielding chunks as GigaChat streams them"""
+        return self.chat.stream(self.build_messages(text))
+
+    def inference_batch(self, texts):
+        """Generate answers for several inputs, sent concurrently within the client's concurrency limit"""
+        return self.chat.chat_many([self.build_messages(text) for text in texts])
+
+
+
+class Solar(VllmModel):
+    def config_prompt(self, system_prompt):
+        """Configure or update the system prompt."""
+        self.system_prompt = "<s>### System: " + system_prompt
         
-        self.messages = []
-        self.messages.append(SystemMessage(content=self.system_prompt))
-#         message = self.messages.copy()
-        self.messages.append(HumanMessage(content=text))
-        res = self.chat(self.messages)
-        
-        return res.content
 
+    def build_prompt(self, text):
+        return self.system_prompt + '\n### User: ' + text + '\n### Assistant: '
 
 
-class Solar(GenerativeModel):
-    def __init__(self, model_name, model_path, system_prompt=''):
+
+class LlamaCpp(GenerativeModel):
+    """Quantized GGUF build of Mistral-7B-Instruct run by llama.cpp on CPU threads, no GPU or vLLM needed."""
+
+    def __init__(self, model_name, model_path, system_prompt='', n_threads=0, n_ctx=4096,
+                 repo_id=None, filename=None):
         super().__init__(model_name, system_prompt)
         self.model_path = model_path
-        self.load() 
+        self.n_threads = n_threads or os.cpu_count()
+        self.n_ctx = n_ctx
+        self.repo_id = repo_id
+        self.filename = filename
+        # контекст llama.cpp не потокобезопасен, запросы сессий выполняются по очереди
+        self.lock = threading.Lock()
+        self.config_prompt(system_prompt)
+        self.load()
 
     def load(self):
-        self.model = LLM(model=self.model_path, 
-                  trust_remote_code=True, 
-                  seed=42)
+        from llama_cpp import Llama
+
+        kwargs = dict(n_ctx=self.n_ctx, n_threads=self.n_threads, n_gpu_layers=0, seed=42, verbose=False)
+        if not os.path.exists(self.model_path) and self.repo_id:
+            self.model = Llama.from_pretrained(self.repo_id, self.filename,
+                                               local_dir=os.path.dirname(self.model_path) or '.', **kwargs)
+        else:
+            self.model = Llama(model_path=self.model_path, **kwargs)
 
     def config_prompt(self, system_prompt):
         """Configure or update the system prompt."""
-        self.system_prompt = "<s>### System: " + system_prompt
+        # BOS добавляет токенизатор llama.cpp, поэтому <s> в тексте не нужен
+        self.system_prompt = "[INST] " + system_prompt
         
 
-    def inference(self, text, top_p=0.6, temperature=0.8, repetition_penalty=1.0, max_new_tokens=2000,
-                  skip_special_tokens=False):
+    def build_prompt(self, text):
+        return self.system_prompt + '\n' + text + ' [/INST] '
+
+    def inference(self, text, top_p=0.6, temperature=0.8, repetition_penalty=1.0, max_new_tokens=2000):
         """Generate text based on the provided input"""
-        sampling_params = SamplingParams(top_p=top_p, temperature=temperature, repetition_penalty=repetition_penalty,
-                                         max_tokens=max_new_tokens)
-        
-        prompt = self.system_prompt + '\n### User: ' + text + '\n### Assistant: '
-        
-        output = self.model.generate(prompt, sampling_params)
-        
-        prompt = output[0].prompt
-        generated_text = output[0].outputs[0].text
-        
-        return generated_text
+        return ''.join(self.inference_stream(text, top_p, temperature, repetition_penalty, max_new_tokens))
+
+    def inference_stream(self, text, top_p=0.6, temperature=0.8, repetition_penalty=1.0, max_new_tokens=2000):
+        """Generate text based on the provided input, yielding it token by token"""
+        with self.lock:
+            for chunk in self.model(self.build_prompt(text), max_tokens=max_new_tokens, top_p=top_p,
+                                    temperature=temperature, repeat_penalty=repetition_penalty, stream=True):
+                yield chunk['choices'][0]['text']
+
+
+def benchmark_llama_cpp(model_path, prompt, thread_counts=(1, 2, 4, 8), max_new_tokens=64):
+    """Prompt processing and generation speed of the GGUF model, in tokens per second and per core."""
+    from llama_cpp import Llama
+
+    results = []
+    for n_threads in thread_counts:
+        model = Llama(model_path=model_path, n_ctx=4096, n_threads=n_threads, n_gpu_layers=0, seed=42, verbose=False)
+        prompt_tokens = len(model.tokenize(prompt.encode('utf-8')))
+        model(prompt, max_tokens=1)  # прогрев
+        model.reset()
+        start = time.perf_counter()
+        model(prompt, max_tokens=1)
+        prefill = time.perf_counter() - start
+        model.reset()
+        start = time.perf_counter()
+        output = model(prompt, max_tokens=max_new_tokens, temperature=0)
+        generated = output['usage']['completion_tokens']
+        decode = max(time.perf_counter() - start - prefill, 1e-9)
+        results.append({"threads": n_threads,
+                        "prompt_tokens_per_s": round(prompt_tokens / prefill, 1),
+                        "generated_tokens_per_s": round(generated / decode, 2),
+                        "generated_tokens_per_s_per_core": round(generated / decode / n_threads, 2)})
+        del model
+    return results
+
+
+if __name__ == "__main__":
+    # скорость GGUF модели на CPU в зависимости от числа потоков: python -m utils.generatives
+    from utils.config import GenerationConfig, LocalModelConfig
+
+    config = LocalModelConfig()
+    prompt = "[INST] " + GenerationConfig.system_prompt + "\nВопрос: Как подключить платежи? [/INST] "
+    thread_counts = sorted({1, 2, 4, os.cpu_count()})
+    for row in benchmark_llama_cpp(config.gguf_path, prompt, thread_counts):
+        print(row)
@@ -1,28 +1,111 @@
+import time
+import logging
+
 from utils.ranking import  *
+from utils.colbert_index import ColbertReranker
+from utils.config import RerankCascadeConfig, ContextConfig
+from utils.context_packer import format_passage, pack_context, token_counter
 
-def get_documents(query, existing_pipeline, RAG, content_old, meta):
-    raw_results = existing_pipeline.query(query, k=20)
-    seq = {i['content']: i['index'] for i in raw_results}
-    documents_as_strings = [i['content'] for i in raw_results] # поиск делаем только по пассажу
-    contents = RAG.rerank(query=query, documents=documents_as_strings, k=5)
-    indexes = [seq.get(elem['content']) for elem in contents]
-    
-    context1 = content_old[indexes[0]]
-    meta1 = meta[indexes[0]]
-    
-    context2 = content_old[indexes[1]]
-    meta2 = meta[indexes[1]]
-    
-    context3 = content_old[indexes[2]]
-    meta3 = meta[indexes[2]]
-    
+logger = logging.getLogger(__name__)
+
+
+def build_prompt(query, passages):
+    context = '\n        '.join(format_passage(passage['page_content'], passage['metadata']) for passage in passages)
     prompt = f"""
         Вопрос:{query}
         Ответь на вопрос, используя контекст
-        '{context1}. Ссылка: {meta1.get('current_url', '-')}',
-        '{context2}. Ссылка: {meta2.get('current_url', '-')}',
-        '{context3}. Ссылка: {meta3.get('current_url', '-')}'
+        {context}
         Ответ:
         
     """
-    return prompt, context1, meta1, context2, meta2, context3, meta3
\ No newline at end of file
+    return prompt
+
+
+def pack_documents(query, indexes, content_old, meta, context):
+    passages = pack_context(indexes, content_old, meta, token_counter(context.tokenizer_name), context)
+    return build_prompt(query, passages), passages
+
+
+def rerank(query, raw_results, RAG, k=5):
+    """Returns chunk ids of the best candidates: by stored token embeddings (ColbertReranker) or by raw texts."""
+    if isinstance(RAG, ColbertReranker):
+        return [elem['index'] for elem in RAG.rerank_ids(query, [i['index'] for i in raw_results], k=k)]
+    seq = {i['content']: i['index'] for i in raw_results}
+    documents_as_strings = [i['content'] for i in raw_results] # поиск делаем только по пассажу
+    contents = RAG.rerank(query=query, documents=documents_as_strings, k=k)
+    return [seq.get(elem['content']) for elem in contents]
+
+
+def plan_rerank(raw_results, cascade, fusion="dense"):
+    """
+    Chooses how much reranking a query needs from the first stage scores.
+    Returns (decision, candidates, stats): "skip" - keep the first stage order, "shrink" - rerank the head only,
+    "widen" - scores are flat, rerank all max_k candidates, "full" - rerank base_k candidates.
+    Margins are in units of the first stage score, so the thresholds of the fusion mode that produced it are used.
+    """
+    if not cascade.enabled or len(raw_results) < 2:
+        return "full", raw_results[:cascade.base_k], {}
+
+    scores = [i['score'] for i in raw_results]
+    margin = scores[0] - scores[1]
+    spread = scores[0] - scores[min(cascade.flat_window, len(scores)) - 1]
+    stats = {"fusion": fusion, "margin": round(margin, 5), "spread": round(spread, 5)}
+    if margin >= cascade.skip_margin[fusion]:
+        return "skip", raw_results, stats
+    if spread <= cascade.flat_spread[fusion]:
+        return "widen", raw_results[:cascade.max_k], stats
+    if margin >= cascade.shrink_margin[fusion]:
+        return "shrink", raw_results[:cascade.shrink_k], stats
+    return "full", raw_results[:cascade.base_k], stats
+
+
+def _log_plan(query, decision, candidates, stats, started):
+    logger.info("rerank cascade: decision=%s depth=%d %s retrieval+rerank=%.1fms query=%r",
+                decision, 0 if decision == "skip" else len(candidates), stats,
+                (time.perf_counter() - started) * 1000, query)
+
+
+def get_documents(query, existing_pipeline, RAG, content_old, meta, cascade=None, query_embedding=None,
+                  context=None):
+    """Returns the prompt and the passages put into it, see pack_context."""
+    cascade = cascade or RerankCascadeConfig()
+    context = context or ContextConfig()
+    started = time.perf_counter()
+    raw_results = existing_pipeline.query(query, k=cascade.max_k if cascade.enabled else cascade.base_k,
+                                          query_embedding=query_embedding)
+    decision, candidates, stats = plan_rerank(raw_results, cascade, existing_pipeline.config.fusion)
+    if decision == "skip":
+        indexes = [i['index'] for i in candidates[:context.rerank_k]]
+    else:
+        indexes = rerank(query, candidates, RAG, k=context.rerank_k)
+    _log_plan(query, decision, candidates, stats, started)
+    return pack_documents(query, indexes, content_old, meta, context)
+
+
+def get_documents_batch(queries, existing_pipeline, RAG, content_old, meta, cascade=None, context=None):
+    """
+    Batched get_documents: one embedding call and one index query for all queries.
+    ColbertReranker encodes all queries at once; RAG.rerank scores every query against one shared
+    document list, so with it candidates are reranked per query.
+    """
+    cascade = cascade or RerankCascadeConfig()
+    context = context or ContextConfig()
+    started = time.perf_counter()
+    raw_results = existing_pipeline.query_batch(queries, k=cascade.max_k if cascade.enabled else cascade.base_k)
+    plans = [plan_rerank(results, cascade, existing_pipeline.config.fusion) for results in raw_results]
+
+    indexes = [[i['index'] for i in candidates[:context.rerank_k]] for _, candidates, _ in plans]
+    to_rerank = [n for n, (decision, _, _) in enumerate(plans) if decision != "skip"]
+    if isinstance(RAG, ColbertReranker):
+        ranked = RAG.rerank_ids_batch([queries[n] for n in to_rerank],
+                                      [[i['index'] for i in plans[n][1]] for n in to_rerank], k=context.rerank_k)
+        for n, results in zip(to_rerank, ranked):
+            indexes[n] = [elem['index'] for elem in results]
+    else:
+        for n in to_rerank:
+            indexes[n] = rerank(queries[n], plans[n][1], RAG, k=context.rerank_k)
+
+    for query, (decision, candidates, stats) in zip(queries, plans):
+        _log_plan(query, decision, candidates, stats, started)
+    return [pack_documents(query, query_indexes, content_old, meta, context)
+            for query, query_indexes in zip(queries, indexes)]
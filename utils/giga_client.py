@@ -0,0 +1,291 @@
+import ssl
+import json
+import time
+import uuid
+import random
+import asyncio
+import logging
+import threading
+from concurrent.futures import CancelledError
+from typing import AsyncIterator, Dict, List, Optional
+
+import aiohttp
+
+from utils.config import GigaChatConfig
+
+logger = logging.getLogger(__name__)
+
+# коды, после которых запрос имеет смысл повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class GigaChatError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"GigaChat API {status}: {message}")
+        self.status = status
+
+
+class AsyncGigaChatClient:
+    """
+    asyncio client of the GigaChat REST API: one pooled aiohttp session, the OAuth token is reused until
+    shortly before it expires, at most max_concurrency requests are in flight, every call has a deadline
+    and failed calls (timeouts, connection errors, 429 and 5xx) are retried with full jitter backoff.
+    """
+
+    def __init__(self, config: Optional[GigaChatConfig] = None):
+        self.config = config or GigaChatConfig()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._token_lock: Optional[asyncio.Lock] = None
+        self._token: Optional[str] = None
+        self._token_expires_at = 0.0
+
+    async def _ensure_session(self) -> aiohttp.ClientSession:
+        # сессия и примитивы синхронизации создаются в цикле событий, в котором работает клиент
+        if self._session is None or self._session.closed:
+            ssl_context = None if self.config.verify_ssl else False
+            if self.config.ca_bundle:
+                ssl_context = ssl.create_default_context(cafile=self.config.ca_bundle)
+            connector = aiohttp.TCPConnector(limit=self.config.max_connections, ssl=ssl_context)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._semaphore = asyncio.Semaphore(self.config.max_concurrency)
+            self._token_lock = asyncio.Lock()
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+    async def _get_token(self, refresh: bool = False) -> str:
+        async with self._token_lock:
+            if not refresh and self._token and time.time() < self._token_expires_at - self.config.token_refresh_margin:
+                return self._token
+            headers = {"Authorization": f"Basic {self.config.credentials}",
+                       "RqUID": str(uuid.uuid4()),
+                       "Content-Type": "application/x-www-form-urlencoded",
+                       "Accept": "application/json"}
+            timeout = aiohttp.ClientTimeout(total=self.config.timeout_seconds)
+            async with self._session.post(self.config.auth_url, data={"scope": self.config.scope},
+                                          headers=headers, timeout=timeout) as response:
+                if response.status != 200:
+                    raise GigaChatError(response.status, await response.text())
+                payload = await response.json()
+            self._token = payload["access_token"]
+            # expires_at приходит в миллисекундах
+            self._token_expires_at = payload["expires_at"] / 1000
+            return self._token
+
+    def _payload(self, messages: List[Dict[str, str]], stream: bool, **params) -> Dict:
+        return {"model": self.config.model, "messages": messages, "stream": stream, **params}
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.config.backoff_max, self.config.backoff_base * 2 ** attempt))
+
+    async def _with_retries(self, call, deadline: float, acquire: bool = True):
+        """
+        Runs call(token) until it succeeds, the retries are spent or the deadline passes.
+        acquire=False when the caller already holds a concurrency slot.
+        """
+        await self._ensure_session()
+        attempt = 0
+        refreshed = False
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError("GigaChat request deadline exceeded")
+            try:
+                if not acquire:
+                    token = await self._get_token()
+                    return await asyncio.wait_for(call(token), timeout=deadline - time.monotonic())
+                async with self._semaphore:
+                    token = await self._get_token()
+                    return await asyncio.wait_for(call(token), timeout=deadline - time.monotonic())
+            except GigaChatError as e:
+                if e.status == 401 and not refreshed:
+                    refreshed = True
+                    self._token = None
+                    continue
+                if e.status not in RETRY_STATUSES or attempt >= self.config.max_retries:
+                    raise
+                error = e
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError) as e:
+                if attempt >= self.config.max_retries:
+                    raise
+                error = e
+            delay = min(self._backoff(attempt), max(deadline - time.monotonic(), 0))
+            logger.warning("GigaChat call failed (%r), retry %d in %.2fs", error, attempt + 1, delay)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def chat(self, messages: List[Dict[str, str]], timeout: Optional[float] = None, **params) -> str:
+        """Complete answer to the messages ({"role", "content"} dicts)."""
+        async def call(token):
+            async with self._session.post(f"{self.config.base_url}/chat/completions",
+                                          json=self._payload(messages, False, **params),
+                                          headers={"Authorization": f"Bearer {token}"}) as response:
+                if response.status != 200:
+                    raise GigaChatError(response.status, await response.text())
+                payload = await response.json()
+            return payload["choices"][0]["message"]["content"]
+
+        return await self._with_retries(call, time.monotonic() + (timeout or self.config.timeout_seconds))
+
+    async def stream(self, messages: List[Dict[str, str]], timeout: Optional[float] = None,
+                     **params) -> AsyncIterator[str]:
+        """
+        Answer deltas from the server-sent events stream. Only establishing the stream is retried:
+        once text has been yielded a failure is raised to the caller.
+        """
+        deadline = time.monotonic() + (timeout or self.config.timeout_seconds)
+
+        async def call(token):
+            response = await self._session.post(f"{self.config.base_url}/chat/completions",
+                                                json=self._payload(messages, True, **params),
+                                                headers={"Authorization": f"Bearer {token}",
+                                                         "Accept": "text/event-stream"})
+            if response.status != 200:
+                message = await response.text()
+                response.release()
+                raise GigaChatError(response.status, message)
+            return response
+
+        await self._ensure_session()
+        # слот занят на все время чтения потока, а не только на установку соединения
+        async with self._semaphore:
+            response = await self._with_retries(call, deadline, acquire=False)
+            try:
+                while True:
+                    line = await asyncio.wait_for(response.content.readline(), timeout=deadline - time.monotonic())
+                    if not line:
+                        break
+                    line = line.decode("utf-8").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    delta = json.loads(data)["choices"][0]["delta"].get("content")
+                    if delta:
+                        yield delta
+            finally:
+                response.release()
+
+
+class GigaChatStream:
+    """
+    Synchronous iterator over a stream of AsyncGigaChatClient running on the client loop.
+    cancel() may be called from any thread: the pending read is cancelled at once, so a stalled request
+    releases its connection and concurrency slot without waiting for the next delta.
+    """
+
+    def __init__(self, run, iterator: AsyncIterator[str]):
+        self._run = run
+        self._iterator = iterator
+        self._future = None
+        self._task = None
+        self._cancelled = False
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        return self
+
+    async def _next(self) -> str:
+        self._task = asyncio.current_task()
+        return await self._iterator.__anext__()
+
+    async def _aclose(self) -> None:
+        # отмененное чтение завершается в цикле клиента позже, чем отменяется его future
+        if self._task is not None and not self._task.done():
+            await asyncio.wait([self._task])
+        await self._iterator.aclose()
+
+    def __next__(self) -> str:
+        with self._lock:
+            if self._cancelled:
+                raise StopIteration
+            self._future = self._run(self._next())
+        try:
+            return self._future.result()
+        except (StopAsyncIteration, CancelledError):
+            raise StopIteration
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._cancelled = True
+            if self._future is not None:
+                self._future.cancel()
+
+    def close(self) -> None:
+        self._run(self._aclose()).result()
+
+
+class GigaChatClient:
+    """Synchronous facade for Streamlit threads: the async client runs on its own event loop thread."""
+
+    def __init__(self, config: Optional[GigaChatConfig] = None):
+        self.client = AsyncGigaChatClient(config)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="gigachat-client", daemon=True)
+        self.thread.start()
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def chat(self, messages: List[Dict[str, str]], **params) -> str:
+        return self._run(self.client.chat(messages, **params)).result()
+
+    def chat_many(self, batch: List[List[Dict[str, str]]], **params) -> List[str]:
+        """Sends all conversations concurrently, bounded by max_concurrency."""
+        async def gather():
+            return await asyncio.gather(*(self.client.chat(messages, **params) for messages in batch))
+
+        return self._run(gather()).result()
+
+    def stream(self, messages: List[Dict[str, str]], **params) -> GigaChatStream:
+        return GigaChatStream(self._run, self.client.stream(messages, **params))
+
+
+async def _benchmark(config: GigaChatConfig, requests: int) -> Dict:
+    client = AsyncGigaChatClient(config)
+    messages = [{"role": "system", "content": "Ты Ассистент поддержки RuStore."},
+                {"role": "user", "content": "Как подключить платежи?"}]
+    latencies, failures = [], 0
+
+    async def one():
+        nonlocal failures
+        start = time.perf_counter()
+        try:
+            await client.chat(messages)
+            latencies.append(time.perf_counter() - start)
+        except Exception:
+            failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    await client.close()
+    latencies.sort()
+    percentile = lambda q: latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1000 if latencies else None
+    return {"requests": requests, "failures": failures, "throughput_rps": round(requests / elapsed, 1),
+            "p50_ms": percentile(0.5), "p99_ms": percentile(0.99)}
+
+
+if __name__ == "__main__":
+    # нагрузка на локальную заглушку API: python -m utils.giga_client
+    from aiohttp import web
+    from utils.giga_stub import make_app
+
+    async def run():
+        for failure_rate in (0.0, 0.2):
+            app = make_app(latency_seconds=0.2, latency_jitter=0.1, failure_rate=failure_rate)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            config = GigaChatConfig(credentials="stub", base_url=f"http://127.0.0.1:{port}/api/v1",
+                                    auth_url=f"http://127.0.0.1:{port}/api/v2/oauth", backoff_base=0.05)
+            print(f"failure_rate={failure_rate}", await _benchmark(config, requests=200))
+            await runner.cleanup()
+
+    asyncio.run(run())
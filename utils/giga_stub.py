@@ -0,0 +1,88 @@
+import json
+import time
+import uuid
+import random
+import asyncio
+
+from aiohttp import web
+
+STUB_ANSWER = ("Для подключения платежей зарегистрируйте приложение в консоли RuStore и подключите SDK платежей. "
+               "Подробнее: https://www.rustore.ru/help/sdk/payments")
+
+
+def make_app(latency_seconds: float = 0.5, latency_jitter: float = 0.2, failure_rate: float = 0.0,
+             rate_limit_rate: float = 0.0, token_ttl_seconds: float = 1800,
+             chunk_delay_seconds: float = 0.02) -> web.Application:
+    """
+    Local imitation of the GigaChat API (OAuth and chat/completions, plain and streaming) for offline
+    load and failure testing. Latency is latency_seconds +- latency_jitter; failure_rate of requests get
+    503 and rate_limit_rate get 429; tokens expire after token_ttl_seconds.
+    """
+    tokens = {}
+    stats = {"oauth": 0, "completions": 0, "failures": 0, "rate_limited": 0}
+
+    async def oauth(request):
+        stats["oauth"] += 1
+        if not request.headers.get("Authorization", "").startswith("Basic "):
+            return web.json_response({"message": "no credentials"}, status=401)
+        token = uuid.uuid4().hex
+        expires_at = time.time() + token_ttl_seconds
+        tokens[token] = expires_at
+        return web.json_response({"access_token": token, "expires_at": int(expires_at * 1000)})
+
+    async def completions(request):
+        stats["completions"] += 1
+        token = request.headers.get("Authorization", "")[len("Bearer "):]
+        if tokens.get(token, 0) < time.time():
+            return web.json_response({"message": "token expired"}, status=401)
+
+        await asyncio.sleep(max(0.0, random.uniform(latency_seconds - latency_jitter,
+                                                    latency_seconds + latency_jitter)))
+        roll = random.random()
+        if roll < failure_rate:
+            stats["failures"] += 1
+            return web.json_response({"message": "service unavailable"}, status=503)
+        if roll < failure_rate + rate_limit_rate:
+            stats["rate_limited"] += 1
+            return web.json_response({"message": "too many requests"}, status=429)
+
+        payload = await request.json()
+        if not payload.get("stream"):
+            return web.json_response({
+                "choices": [{"message": {"role": "assistant", "content": STUB_ANSWER},
+                             "index": 0, "finish_reason": "stop"}],
+                "created": int(time.time()), "model": payload.get("model"), "object": "chat.completion"})
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for word in STUB_ANSWER.split(" "):
+            chunk = {"choices": [{"delta": {"content": word + " "}, "index": 0}]}
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            await asyncio.sleep(chunk_delay_seconds)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def get_stats(request):
+        return web.json_response(stats)
+
+    app = web.Application()
+    app.router.add_post("/api/v2/oauth", oauth)
+    app.router.add_post("/api/v1/chat/completions", completions)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+if __name__ == "__main__":
+    # GigaChatConfig(base_url="http://127.0.0.1:8090/api/v1", auth_url="http://127.0.0.1:8090/api/v2/oauth")
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local GigaChat API stub")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    web.run_app(make_app(args.latency, args.jitter, args.failure_rate, args.rate_limit_rate),
+                host="127.0.0.1", port=args.port)
@@ -0,0 +1,123 @@
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from utils.config import HedgingConfig
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyHistogram:
+    """Sliding window of complete answer latencies of one backend, thread-safe."""
+
+    def __init__(self, window: int = 500):
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._latencies)
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+
+def hedge_delay(histogram: LatencyHistogram, config: HedgingConfig) -> float:
+    """How long the primary backend runs alone: its latency percentile once enough answers are seen."""
+    if len(histogram) < config.min_samples:
+        return config.default_delay_seconds
+    return max(config.min_delay_seconds, histogram.percentile(config.percentile))
+
+
+def cancel_stream(stream) -> None:
+    """Aborts the request of a stream from another thread, if the backend supports it (vLLM, GigaChat)."""
+    cancel = getattr(stream, 'cancel', None)
+    if cancel is not None:
+        cancel()
+
+
+def _consume(stream, cancelled: threading.Event) -> Optional[str]:
+    """Reads the stream to the end, None if cancelled. Closing the stream aborts the request in the backend."""
+    answer = ''
+    try:
+        # отмена могла прийти до того, как поток стал виден отменяющему
+        if cancelled.is_set():
+            return None
+        for delta in stream:
+            if cancelled.is_set():
+                return None
+            answer += delta
+        if cancelled.is_set():
+            return None
+    finally:
+        close = getattr(stream, 'close', None)
+        if close is not None:
+            close()
+    return answer
+
+
+def hedged_generate(primary: str, secondary: str, stream_factories: Dict[str, Callable[[], Iterator[str]]],
+                    histograms: Dict[str, LatencyHistogram], config: HedgingConfig) -> Tuple[str, str, bool]:
+    """
+    Sends the request to the primary backend and, if it has not answered within hedge_delay (or failed),
+    also to the secondary one. The first complete answer wins and the other request is cancelled.
+    Returns (backend name, answer, whether the hedge request was sent).
+    """
+    cancel = {primary: threading.Event(), secondary: threading.Event()}
+    streams = {}
+
+    def run(name):
+        start = time.perf_counter()
+        streams[name] = stream_factories[name]()
+        answer = _consume(streams[name], cancel[name])
+        if answer is not None or name == primary:
+            # отмененный основной бэкенд записывается со временем до отмены (цензурированный замер):
+            # иначе в гистограмме остаются только быстрые ответы, и задержка хеджирования сползает вниз
+            histograms[name].record(time.perf_counter() - start)
+        return name, answer
+
+    executor = ThreadPoolExecutor(max_workers=2)
+    try:
+        futures = {executor.submit(run, primary)}
+        done, _ = wait(futures, timeout=hedge_delay(histograms[primary], config))
+        hedged = False
+        while True:
+            if not done and not hedged:
+                hedged = True
+                logger.info("hedging %s with %s", primary, secondary)
+                futures.add(executor.submit(run, secondary))
+            for future in done:
+                futures.discard(future)
+                try:
+                    name, answer = future.result()
+                except Exception:
+                    logger.exception("Generation failed")
+                    continue
+                if answer is not None:
+                    for other, event in cancel.items():
+                        if other != name:
+                            # запрос прерывается сразу, а не на следующей дельте: зависший бэкенд
+                            # освобождает соединение и слот конкурентности
+                            event.set()
+                            if other in streams:
+                                cancel_stream(streams[other])
+                    return name, answer, hedged
+            if not futures:
+                if hedged:
+                    raise RuntimeError(f"Both {primary} and {secondary} failed")
+                # основной бэкенд упал раньше задержки - запасной запускается сразу
+                done = set()
+                continue
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+    finally:
+        executor.shutdown(wait=False)
@@ -0,0 +1,136 @@
+import os
+from typing import List, Union
+
+import numpy as np
+import onnxruntime as ort
+from tqdm import tqdm
+from transformers import AutoTokenizer
+
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model_int8.onnx"
+
+
+def export_onnx(model_name: str, output_dir: str, quantize: bool = True, opset: int = 14) -> str:
+    """
+    Exports the whole SentenceTransformer forward (transformer + pooling + normalize) to ONNX,
+    optionally with dynamic int8 quantization of the weights. Returns the path of the model to run.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    class SentenceEmbedding(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            features = self.model({"input_ids": input_ids, "attention_mask": attention_mask})
+            return features["sentence_embedding"]
+
+    os.makedirs(output_dir, exist_ok=True)
+    model = SentenceTransformer(model_name, device="cpu").eval()
+    model.tokenizer.save_pretrained(output_dir)
+
+    dummy = model.tokenizer(["query: пример"], return_tensors="pt")
+    model_path = os.path.join(output_dir, MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            SentenceEmbedding(model),
+            (dummy["input_ids"], dummy["attention_mask"]),
+            model_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["sentence_embedding"],
+            dynamic_axes={"input_ids": {0: "batch", 1: "sequence"},
+                          "attention_mask": {0: "batch", 1: "sequence"},
+                          "sentence_embedding": {0: "batch"}},
+            opset_version=opset,
+        )
+    if not quantize:
+        return model_path
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantized_path = os.path.join(output_dir, QUANTIZED_MODEL_FILE)
+    # fp32 e5-large is larger than the 2GB protobuf limit, its weights are stored as external data
+    quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8, use_external_data_format=True)
+    return quantized_path
+
+
+class OnnxEmbedder:
+    """
+    Drop-in replacement for the SentenceTransformer calls used by MyExistingRetrievalPipeline,
+    running the exported encoder with onnxruntime on CPU. The model is exported on first use.
+    """
+
+    def __init__(self, model_name: str, onnx_dir: str = "./indexes/onnx_e5", quantize: bool = True,
+                 max_seq_length: int = 512, num_threads: int = 0):
+        model_path = os.path.join(onnx_dir, QUANTIZED_MODEL_FILE if quantize else MODEL_FILE)
+        if not os.path.exists(model_path):
+            model_path = export_onnx(model_name, onnx_dir, quantize=quantize)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = num_threads  # 0 - all physical cores
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(onnx_dir)
+        self.max_seq_length = max_seq_length
+        self.dimension = self.session.get_outputs()[0].shape[-1]
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, show_progress_bar: bool = False,
+               **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+
+        # sort by length so that each batch is padded to similar lengths
+        order = np.argsort([-len(sentence) for sentence in sentences])
+        embeddings = [None] * len(sentences)
+        batches = range(0, len(sentences), batch_size)
+        for start in tqdm(batches, disable=not show_progress_bar):
+            batch_ids = order[start:start + batch_size]
+            tokens = self.tokenizer([sentences[i] for i in batch_ids], padding=True, truncation=True,
+                                    max_length=self.max_seq_length, return_tensors="np")
+            output = self.session.run(None, {"input_ids": tokens["input_ids"].astype(np.int64),
+                                             "attention_mask": tokens["attention_mask"].astype(np.int64)})[0]
+            for i, embedding in zip(batch_ids, output):
+                embeddings[i] = embedding
+
+        embeddings = np.stack(embeddings) if embeddings else np.empty((0, 0), dtype=np.float32)
+        return embeddings[0] if single else embeddings
+
+
+def check_parity(onnx_embedder: OnnxEmbedder, torch_embedder, sentences: List[str],
+                 min_cosine: float = 0.99) -> dict:
+    """Compares ONNX and PyTorch embeddings of the same sentences, raises if they diverge."""
+    onnx_embeddings = onnx_embedder.encode(sentences)
+    torch_embeddings = torch_embedder.encode(sentences)
+    cosine = np.sum(onnx_embeddings * torch_embeddings, axis=1) / (
+        np.linalg.norm(onnx_embeddings, axis=1) * np.linalg.norm(torch_embeddings, axis=1))
+    report = {"min_cosine": float(cosine.min()),
+              "mean_cosine": float(cosine.mean()),
+              "max_abs_diff": float(np.abs(onnx_embeddings - torch_embeddings).max())}
+    if report["min_cosine"] < min_cosine:
+        raise ValueError(f"ONNX embeddings diverge from PyTorch: {report}")
+    return report
+
+
+if __name__ == "__main__":
+    import time
+    from sentence_transformers import SentenceTransformer
+
+    model_name = "embaas/sentence-transformers-multilingual-e5-large"
+    sentences = ["Как подключить платежи в приложении?",
+                 "Что означает нераспределенные платежи?",
+                 "RuStore In-app updates SDK поддерживает актуальную версию приложения на устройстве пользователя."]
+    torch_embedder = SentenceTransformer(model_name, device="cpu")
+    for quantize in (False, True):
+        embedder = OnnxEmbedder(model_name, quantize=quantize)
+        print(f"quantize={quantize}", check_parity(embedder, torch_embedder, sentences, min_cosine=0.95))
+
+    for name, embedder in (("torch", torch_embedder), ("onnx int8", embedder)):
+        start = time.perf_counter()
+        for sentence in sentences * 10:
+            embedder.encode(sentence)
+        print(f"{name}: {(time.perf_counter() - start) / (len(sentences) * 10) * 1000:.1f} ms per query")
@@ -1,70 +1,183 @@
 # !pip install ragatouille -q
 
 from sentence_transformers import SentenceTransformer
-from voyager import Index, Space
+from voyager import Index
 
+import os
 import joblib
-from typing import List, Dict
-from rank_bm25 import BM25Okapi
+import threading
+import numpy as np
+from typing import List, Dict, Optional, Sequence, Tuple, Union
 import pandas as pd
 
+from utils.bm25 import BM25Index
+from utils.chunk_store import ChunkStore
+from utils.config import RetrievalConfig
+from utils.dense import NumpyIndex, create_index, load_index as load_dense_index
+
+FUSION_MODES = ("dense", "rrf", "weighted")
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], rrf_k: int = 60) -> List[Tuple[int, float]]:
+    """Fuses ranked id lists by sum of 1 / (rrf_k + rank). Returns (id, score) sorted by score."""
+    scores = {}
+    for ranking in rankings:
+        for rank, idx in enumerate(ranking, start=1):
+            scores[idx] = scores.get(idx, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def weighted_fusion(dense: Tuple[Sequence[int], Sequence[float]],
+                    lexical: Tuple[Sequence[int], Sequence[float]],
+                    dense_weight: float = 0.7) -> List[Tuple[int, float]]:
+    """Min-max normalizes the scores of each leg and sums them with weights. Returns (id, score) sorted by score."""
+    def normalize(scores):
+        scores = np.asarray(scores, dtype=np.float32)
+        if len(scores) == 0:
+            return scores
+        spread = scores.max() - scores.min()
+        return (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+
+    fused = {}
+    for (ids, scores), weight in ((dense, dense_weight), (lexical, 1.0 - dense_weight)):
+        for idx, score in zip(ids, normalize(scores)):
+            fused[idx] = fused.get(idx, 0.0) + weight * float(score)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
 class MyExistingRetrievalPipeline:
-    index: Index
-    embedder: SentenceTransformer
-    bm25: BM25Okapi
-
-    def __init__(self, embedder_name: str = "embaas/sentence-transformers-multilingual-e5-large"):
-        self.embedder = SentenceTransformer(embedder_name)
-        self.collection_map = {}
-        self.index = Index(
-            Space.Cosine,
-            num_dimensions=self.embedder.get_sentence_embedding_dimension(),
-        )
-        self.bm25 = None
-        self.doc_texts = []
+    index: Union[Index, NumpyIndex]
+    embedder: SentenceTransformer  # or utils.onnx_embedder.OnnxEmbedder with the same encode interface
+    store: ChunkStore
+
+    def __init__(self, embedder_name: str = "embaas/sentence-transformers-multilingual-e5-large",
+                 config: Optional[RetrievalConfig] = None):
+        self.config = config or RetrievalConfig()
+        if self.config.fusion not in FUSION_MODES:
+            raise ValueError(f"Unknown fusion mode {self.config.fusion!r}, expected one of {FUSION_MODES}")
+        if self.config.embedder_backend == "onnx":
+            from utils.onnx_embedder import OnnxEmbedder
+            self.embedder = OnnxEmbedder(embedder_name, onnx_dir=self.config.onnx_dir,
+                                         quantize=self.config.onnx_quantize)
+        else:
+            self.embedder = SentenceTransformer(embedder_name)
+        self.store = None
+        self.index = None  # created on first indexing, backend="auto" needs the corpus size
+        self._bm25 = None
+        self._bm25_loader = None
+        self._bm25_lock = threading.Lock()
+
+    @property
+    def bm25(self) -> BM25Index:
+        """BM25 postings, loaded or built on first use: with fusion="dense" they are never touched."""
+        if self._bm25 is None and self._bm25_loader is not None:
+            with self._bm25_lock:
+                if self._bm25 is None:
+                    self._bm25 = self._bm25_loader()
+        return self._bm25
+
+    def _ensure_index(self, num_docs: int) -> None:
+        if self.index is None:
+            self.index = create_index(self.config.dense_backend,
+                                      self.embedder.get_sentence_embedding_dimension(),
+                                      num_docs=num_docs,
+                                      storage_dtype=self.config.storage_dtype,
+                                      rescore_oversample=self.config.rescore_oversample)
 
     def index_documents(self, df: pd.DataFrame, batch_size: int = 32) -> None: # if we want to batching again
         self.df = df  
-        self.doc_texts = df['Full_Content'].tolist()
-        self.bm25 = BM25Okapi(self.doc_texts)
-
-        for i in range(0, len(df), batch_size):
-            batch = df.iloc[i:i+batch_size]
-            documents = batch['Full_Content'].tolist()
-            embeddings = self.embedder.encode(documents, show_progress_bar=True)
-            for j, embedding in enumerate(embeddings):
-                doc_id = batch.iloc[j]['Meta']
-                self.collection_map[self.index.add_item(embedding)] = {
-                    'doc_id': doc_id,
-                    'content': documents[j]
-                }
-                
-    def save_index(self, index_file_path: str, map_file_path: str, doc_texts_path: str):
-        """Saves the index to a file and the collection map using joblib."""
+        metas = [meta if isinstance(meta, dict) else {} for meta in df.get('Meta', [{}] * len(df))]
+        self.set_chunks(df['Full_Content'].tolist(), metas)
+        self.add_documents(df['Full_Content'].tolist(), list(range(len(df))), batch_size=batch_size)
+
+    def add_documents(self, documents: List[str], ids: List[int], batch_size: int = 32) -> None:
+        """Embeds documents and adds them to the index under the given ids."""
+        self._ensure_index(len(documents))
+        for i in range(0, len(documents), batch_size):
+            embeddings = self.embedder.encode(documents[i:i+batch_size], show_progress_bar=True)
+            self.index.add_items(embeddings, ids=ids[i:i+batch_size])
+
+    def remove_documents(self, ids: List[int]) -> None:
+        """Marks ids as deleted in the index, they are no longer returned by queries."""
+        for idx in ids:
+            self.index.mark_deleted(idx)
+
+    def set_chunks(self, doc_texts: List[str], doc_metas: List[Dict]) -> None:
+        """
+        Replaces the chunk store and the bm25 postings, which are built on first use. Both lists are aligned
+        with index ids, deleted ids hold an empty text and an empty dict.
+        """
+        self.store = ChunkStore.build(doc_texts, doc_metas)
+        self._bm25, self._bm25_loader = None, lambda: BM25Index.build(doc_texts)
+
+    def save_index(self, index_file_path: str, store_path: str, bm25_path: str):
+        """Saves the index to a file, the chunk store and the bm25 postings to directories."""
         self.index.save(index_file_path)  # Utilize the index's own save method
-        joblib.dump(self.collection_map, map_file_path)  # Save the collection map separately
-        joblib.dump(self.doc_texts, doc_texts_path) # for bm25 model
-
-    def load_index(self, index_file_path: str, map_file_path: str, doc_texts_path: str):
-        """Loads the index from a file and the collection map using joblib."""
-        index = Index.load(index_file_path) # Utilize the index's own load method
-        self.index = index  
-        self.collection_map = joblib.load(map_file_path)  # Load the collection map separately
-        self.doc_texts = joblib.load(doc_texts_path)
-        self.bm25 = BM25Okapi(self.doc_texts)
-
-    def query(self, query: str, k: int = 10) -> List[Dict[str, str]]:
-        query_embedding = self.embedder.encode(query)
-        dense_results = self.index.query(query_embedding, k=k)[0]
-        dense_docs = [{'index':idx, 'doc_id': self.collection_map[idx]['doc_id'], 'content': self.collection_map[idx]['content']} for idx in dense_results]
-
-        bm25_scores = self.bm25.get_scores(query)
-        sorted_indices = sorted(range(len(bm25_scores)), key=lambda i: bm25_scores[i], reverse=True)
-        bm25_docs = [{'index':idx, 'doc_id': self.collection_map[idx]['doc_id'], 'content': self.collection_map[idx]['content']} for idx in sorted_indices[:k]]
-
-        combined_docs = dense_docs #+ bm25_docs
-        combined_docs = list(set([tuple(doc.items()) for doc in combined_docs]))
-        combined_docs = [dict(doc) for doc in combined_docs]
+        self.store.save(store_path)
+        self.bm25.save(bm25_path)
+
+    def load_index(self, index_file_path: str, store_path: str, bm25_path: str):
+        """
+        Loads the index and memory-maps the chunk store; the bm25 postings are memory-mapped on the first
+        query that fuses with BM25. bm25_path may also be a legacy pickle with raw texts, then postings are
+        built in memory (python -m utils.chunk_store converts it to the postings directory).
+        """
+        # voyager file or NumpyIndex directory, wrapped for rescoring if full precision vectors were saved
+        self.index = load_dense_index(index_file_path, rescore_oversample=self.config.rescore_oversample)
+        self.store = ChunkStore.load(store_path)
+        self._bm25 = None
+        if os.path.isdir(bm25_path):
+            self._bm25_loader = lambda: BM25Index.load(bm25_path)
+        else:
+            self._bm25_loader = lambda: BM25Index.build(joblib.load(bm25_path))
+
+    def _make_doc(self, idx: int, score: float) -> Dict:
+        return {'index': idx,
+                'doc_id': self.store.doc_id(idx),
+                'content': self.store.text(idx),
+                'score': score}
+
+    def _fuse(self, query: str, dense_ids: List[int], dense_scores: List[float], k: int, fusion: str) -> List[Dict]:
+        if fusion == "dense":
+            fused = list(zip(dense_ids, dense_scores))
+        else:
+            bm25_ids, bm25_scores = self.bm25.get_top_k(query, k=k)
+            bm25_ids = bm25_ids.tolist()
+            if fusion == "rrf":
+                fused = reciprocal_rank_fusion([dense_ids, bm25_ids], rrf_k=self.config.rrf_k)
+            elif fusion == "weighted":
+                fused = weighted_fusion((dense_ids, dense_scores), (bm25_ids, bm25_scores.tolist()),
+                                        dense_weight=self.config.dense_weight)
+            else:
+                raise ValueError(f"Unknown fusion mode {fusion!r}, expected one of {FUSION_MODES}")
+
         new_k = 2 * k
-        
-        return combined_docs[:new_k]
+        return [self._make_doc(idx, score) for idx, score in fused[:new_k]]
+
+    def encode_query(self, query: str) -> np.ndarray:
+        return self.embedder.encode(query)
+
+    def query(self, query: str, k: int = 10, fusion: Optional[str] = None,
+              query_embedding: Optional[np.ndarray] = None) -> List[Dict]:
+        """
+        Returns up to 2 * k candidates ordered by score (dense mode returns the k nearest).
+        fusion overrides the configured mode: "dense", "rrf" or "weighted".
+        query_embedding skips encoding when the caller already has it (e.g. for the answer cache).
+        """
+        if query_embedding is None:
+            query_embedding = self.encode_query(query)
+        dense_ids, dense_distances = self.index.query(query_embedding, k=k)
+        dense_scores = 1.0 - dense_distances  # cosine distance -> similarity
+        return self._fuse(query, dense_ids.tolist(), dense_scores.tolist(), k, fusion or self.config.fusion)
+
+    def query_batch(self, queries: List[str], k: int = 10, fusion: Optional[str] = None,
+                    batch_size: int = 64, num_threads: int = -1) -> List[List[Dict]]:
+        """Same as query for many queries: one encode call and one batched index query."""
+        if not queries:
+            return []
+        query_embeddings = self.embedder.encode(queries, batch_size=batch_size)
+        dense_ids, dense_distances = self.index.query(query_embeddings, k=k, num_threads=num_threads)
+        dense_scores = 1.0 - dense_distances
+        fusion = fusion or self.config.fusion
+        return [self._fuse(query, ids.tolist(), scores.tolist(), k, fusion)
+                for query, ids, scores in zip(queries, dense_ids, dense_scores)]
@@ -0,0 +1,201 @@
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import utils.generatives
+from utils.get_prompt import get_documents, get_documents_batch
+from utils.config import GenerationConfig, AnswerCacheConfig, HedgingConfig, LocalModelConfig
+from utils.answer_cache import SemanticAnswerCache
+from utils.hedging import LatencyHistogram, cancel_stream, hedged_generate
+from utils.ranking import MyExistingRetrievalPipeline
+from utils.colbert_index import COLBERT_MODEL_NAME, ColbertDocumentIndex, ColbertReranker
+from ragatouille import RAGPretrainedModel
+
+logger = logging.getLogger(__name__)
+
+# загрузка моделей и обработка запросов, общие для Streamlit (main.py) и HTTP API (api.py)
+
+
+def load_model():
+    local = LocalModelConfig()
+    # системный промпт задается один раз: префикс запроса к vLLM не меняется и берется из кэша
+    if local.backend == "llama_cpp":
+        solar = utils.generatives.LlamaCpp("mistral", local.gguf_path, system_prompt=GenerationConfig.system_prompt,
+                                           n_threads=local.n_threads, n_ctx=local.n_ctx,
+                                           repo_id=local.gguf_repo_id, filename=local.gguf_filename)
+    else:
+        utils.generatives.get_os()
+        solar = utils.generatives.Mistral("mistral", local.model_path, system_prompt=GenerationConfig.system_prompt)
+    giga = utils.generatives.GigaApi("gigachat", system_prompt=GenerationConfig.system_prompt)
+    
+    pipeline = MyExistingRetrievalPipeline()
+    # постинги BM25 из каталога, который пишет update_indexes; bm_cp.pkl переводится python -m utils.chunk_store
+    pipeline.load_index('./indexes/indexes_cp.index',
+                        './indexes/chunks',
+                        './indexes/bm_cp.bm25')
+
+    RAG = RAGPretrainedModel.from_pretrained(COLBERT_MODEL_NAME)
+    if os.path.exists('./indexes/colbert'):
+        # реранжирование по заранее посчитанным эмбеддингам токенов фрагментов
+        RAG = ColbertReranker(RAG, ColbertDocumentIndex.load('./indexes/colbert'))
+    
+    return solar, giga, pipeline, RAG
+
+
+def load_cache():
+    config = AnswerCacheConfig()
+    if not config.enabled and not config.shadow:
+        return None
+    return SemanticAnswerCache(threshold=config.threshold, ttl_seconds=config.ttl_seconds,
+                               max_entries=config.max_entries, version_path=config.version_path,
+                               serve=config.enabled, log_top=config.log_top)
+
+
+def load_latencies():
+    """Latency histograms of the answer backends, shared by all sessions."""
+    return {name: LatencyHistogram(HedgingConfig.window) for name in ("GigaChat", "Mistral")}
+
+
+def load_df(pipeline):
+    # тексты и метаданные читаются из memory-mapped хранилища фрагментов по id
+    return pipeline.store.texts, pipeline.store.metas
+
+def process_query(query, pipeline, RAG, model, df, meta, cache=None):
+    query_embedding = pipeline.encode_query(query)
+    if cache is not None:
+        cached = cache.get(query_embedding, model.model_name, query)
+        if cached is not None:
+            return cached
+
+    prompt, docs = get_documents(query, pipeline, RAG, df, meta, query_embedding=query_embedding)
+    answer = generate_answer(model, prompt)
+
+    result = answer, docs
+    if cache is not None:
+        cache.put(query_embedding, model.model_name, result, query)
+    return result
+
+
+def generate_answer(model, prompt):
+    # GigaApi не принимает параметры генерации
+    try:
+        return model.inference(prompt, max_new_tokens=1000)
+    except TypeError:
+        return model.inference(prompt)
+
+
+def stream_answer(model, prompt):
+    try:
+        return model.inference_stream(prompt, max_new_tokens=1000)
+    except TypeError:
+        return model.inference_stream(prompt)
+
+
+def process_query_concurrent(query, models, pipeline, RAG, df, meta, cache=None, latencies=None, cancelled=None):
+    """
+    Retrieves and builds the prompt once, then streams all models in parallel threads.
+    models maps a display name to a GenerativeModel; yields (name, answer_so_far, docs, done)
+    every time one of the answers grows, cached answers come first and complete.
+    Right after retrieval a (None, '', docs, False) event is yielded, so the documents can be shown
+    before the first token. Closing the generator, or setting the `cancelled` threading.Event from another
+    thread, cancels the generations that are still running.
+    """
+    query_embedding = pipeline.encode_query(query)
+    pending = {}
+    for name, model in models.items():
+        cached = cache.get(query_embedding, model.model_name, query) if cache is not None else None
+        if cached is not None:
+            answer, docs = cached
+            yield name, answer, docs, True
+        else:
+            pending[name] = model
+    if not pending:
+        return
+
+    prompt, docs = get_documents(query, pipeline, RAG, df, meta, query_embedding=query_embedding)
+    yield None, '', docs, False
+    # элементы Streamlit обновляются только из потока скрипта, поэтому потоки генерации пишут в очередь
+    events = queue.Queue()
+    cancelled = cancelled or threading.Event()
+    streams = {}
+
+    def run(name, model):
+        answer = ''
+        start = time.perf_counter()
+        stream = None
+        try:
+            stream = streams[name] = stream_answer(model, prompt)
+            # отмена могла прийти раньше, чем поток появился в streams
+            if cancelled.is_set():
+                return
+            for delta in stream:
+                if cancelled.is_set():
+                    return
+                answer += delta
+                events.put((name, answer, False))
+            if cancelled.is_set():
+                return
+        except Exception:
+            logger.exception("Generation failed for %s", name)
+            events.put((name, answer or "Не удалось получить ответ, попробуйте позже.", True))
+            return
+        finally:
+            close = getattr(stream, 'close', None)
+            if close is not None:
+                close()
+        if latencies is not None:
+            latencies[name].record(time.perf_counter() - start)
+        if cache is not None:
+            cache.put(query_embedding, model.model_name, (answer, docs), query)
+        events.put((name, answer, True))
+
+    with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+        for name, model in pending.items():
+            executor.submit(run, name, model)
+        remaining = len(pending)
+        try:
+            while remaining:
+                try:
+                    name, answer, done = events.get(timeout=0.1)
+                except queue.Empty:
+                    if cancelled.is_set():
+                        return
+                    continue
+                remaining -= done
+                yield name, answer, docs, done
+        finally:
+            if remaining:
+                # клиент ушел: генерации прерываются в бэкенде, а не доходят до конца впустую
+                cancelled.set()
+                for stream in list(streams.values()):
+                    cancel_stream(stream)
+
+
+def process_query_hedged(query, models, pipeline, RAG, df, meta, latencies, config, cache=None):
+    """
+    Fastest acceptable answer: the primary model answers alone unless it is slower than its usual latency,
+    then the secondary one is raced against it. Returns (model name, answer, docs).
+    """
+    query_embedding = pipeline.encode_query(query)
+    for name in (config.primary, config.secondary):
+        cached = cache.get(query_embedding, models[name].model_name, query) if cache is not None else None
+        if cached is not None:
+            answer, docs = cached
+            return name, answer, docs
+
+    prompt, docs = get_documents(query, pipeline, RAG, df, meta, query_embedding=query_embedding)
+    stream_factories = {name: (lambda model=models[name]: stream_answer(model, prompt))
+                        for name in (config.primary, config.secondary)}
+    name, answer, hedged = hedged_generate(config.primary, config.secondary, stream_factories, latencies, config)
+    if cache is not None:
+        cache.put(query_embedding, models[name].model_name, (answer, docs), query)
+    return name, answer, docs
+
+
+def process_queries(queries, pipeline, RAG, model, df, meta):
+    """Batched process_query for offline jobs (regression runs, FAQ precompute)."""
+    documents = get_documents_batch(queries, pipeline, RAG, df, meta)
+    answers = model.inference_batch([prompt for prompt, _ in documents])
+    return [(answer, docs) for answer, (_, docs) in zip(answers, documents)]
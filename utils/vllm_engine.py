@@ -0,0 +1,217 @@
+import time
+import uuid
+import queue
+import asyncio
+import logging
+import threading
+import dataclasses
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, List
+
+from vllm import SamplingParams
+from vllm.engine.arg_utils import AsyncEngineArgs
+from vllm.engine.async_llm_engine import AsyncLLMEngine
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+def prefix_caching_supported() -> bool:
+    """Automatic prefix caching appeared in vLLM 0.4, older engines do not accept the flag."""
+    return "enable_prefix_caching" in {field.name for field in dataclasses.fields(AsyncEngineArgs)}
+
+
+class AsyncEngineRunner:
+    """
+    vLLM AsyncLLMEngine running on its own event loop thread, so that synchronous callers
+    (Streamlit session threads) can stream tokens from it. It is the process-wide scheduler of a model:
+    requests from all sessions go to the engine's waiting queue and are batched by vLLM's continuous
+    batching. Queue depth and batch size are sampled in the background, see metrics().
+    """
+
+    def __init__(self, model_path: str, max_num_seqs: int = 32, gpu_memory_utilization: float = 0.9,
+                 metrics_interval_seconds: float = 0.1, metrics_window: int = 600,
+                 log_interval_seconds: float = 30, enable_prefix_caching: bool = True, **engine_kwargs):
+        if enable_prefix_caching:
+            if prefix_caching_supported():
+                engine_kwargs["enable_prefix_caching"] = True
+            else:
+                logger.warning("This vLLM version has no automatic prefix caching, the system prompt is prefilled "
+                               "on every request")
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="vllm-engine", daemon=True)
+        self.thread.start()
+        args = AsyncEngineArgs(model=model_path, trust_remote_code=True, seed=42, max_num_seqs=max_num_seqs,
+                               gpu_memory_utilization=gpu_memory_utilization, **engine_kwargs)
+        self.engine = AsyncLLMEngine.from_engine_args(args)
+
+        self.in_flight = 0
+        self.requests_total = 0
+        self._samples = deque(maxlen=metrics_window)  # (queue_depth, batch_size) while the engine is busy
+        self._metrics_lock = threading.Lock()
+        self._submit(self._sample_metrics(metrics_interval_seconds, log_interval_seconds))
+
+    def _submit(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def _scheduler_state(self):
+        """(waiting, running) sequence groups of the engine scheduler, our own counter when it is remote."""
+        scheduler = getattr(self.engine.engine, "scheduler", None)
+        if scheduler is None:
+            return self.in_flight, 0
+        return len(scheduler.waiting) + len(scheduler.swapped), len(scheduler.running)
+
+    async def _sample_metrics(self, interval: float, log_interval: float):
+        last_log = time.monotonic()
+        while True:
+            await asyncio.sleep(interval)
+            queue_depth, batch_size = self._scheduler_state()
+            if not queue_depth and not batch_size:
+                continue
+            with self._metrics_lock:
+                self._samples.append((queue_depth, batch_size))
+            if time.monotonic() - last_log >= log_interval:
+                last_log = time.monotonic()
+                logger.info("vLLM scheduler: %s", self.metrics())
+
+    def metrics(self) -> Dict[str, float]:
+        """Current queue depth and batch size, and their mean / max over the recent busy samples."""
+        queue_depth, batch_size = self._scheduler_state()
+        with self._metrics_lock:
+            samples = list(self._samples)
+        queue_depths = [sample[0] for sample in samples] or [0]
+        batch_sizes = [sample[1] for sample in samples] or [0]
+        return {"in_flight": self.in_flight,
+                "requests_total": self.requests_total,
+                "queue_depth": queue_depth,
+                "batch_size": batch_size,
+                "mean_queue_depth": sum(queue_depths) / len(queue_depths),
+                "max_queue_depth": max(queue_depths),
+                "mean_batch_size": sum(batch_sizes) / len(batch_sizes),
+                "max_batch_size": max(batch_sizes)}
+
+    async def _generate(self, prompt: str, sampling_params: SamplingParams, request_id: str):
+        self.in_flight += 1
+        self.requests_total += 1
+        try:
+            async for output in self.engine.generate(prompt, sampling_params, request_id):
+                yield output
+        finally:
+            self.in_flight -= 1
+
+    def stream(self, prompt: str, sampling_params: SamplingParams) -> "EngineStream":
+        """Yields the generated text in deltas. Closing the iterator early or cancel() aborts the request."""
+        return EngineStream(self, prompt, sampling_params)
+
+    def submit(self, prompt: str, sampling_params: SamplingParams) -> Future:
+        """Queues a prompt from any thread, the future resolves to the complete text."""
+        async def collect():
+            text = ''
+            async for output in self._generate(prompt, sampling_params, uuid.uuid4().hex):
+                text = output.outputs[0].text
+            return text
+
+        return self._submit(collect())
+
+    def generate(self, prompts: List[str], sampling_params: SamplingParams) -> List[str]:
+        """Complete texts for all prompts, submitted to the engine at once."""
+        futures = [self.submit(prompt, sampling_params) for prompt in prompts]
+        return [future.result() for future in futures]
+
+
+class EngineStream:
+    """
+    Deltas of one request of an AsyncEngineRunner. close() from the reading thread or cancel() from any
+    other one aborts the request in the engine, cancel() also wakes up a reader waiting for the next delta.
+    """
+
+    def __init__(self, runner: AsyncEngineRunner, prompt: str, sampling_params: SamplingParams):
+        self.runner = runner
+        self.request_id = uuid.uuid4().hex
+        self.outputs = queue.Queue()
+        self.text = ''
+        self.finished = False
+        runner._submit(self._produce(prompt, sampling_params))
+
+    async def _produce(self, prompt: str, sampling_params: SamplingParams):
+        try:
+            async for output in self.runner._generate(prompt, sampling_params, self.request_id):
+                self.outputs.put(output.outputs[0].text)
+        except BaseException as e:
+            self.outputs.put(e)
+        finally:
+            self.outputs.put(_DONE)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        while not self.finished:
+            item = self.outputs.get()
+            if item is _DONE:
+                self.finished = True
+                break
+            if isinstance(item, BaseException):
+                self.finished = True
+                raise item
+            # RequestOutput содержит весь текст, сгенерированный к этому моменту
+            delta, self.text = item[len(self.text):], item
+            if delta:
+                return delta
+        raise StopIteration
+
+    def cancel(self) -> None:
+        # отмена законченного запроса ничего не делает
+        self.runner._submit(self.runner.engine.abort(self.request_id))
+        self.outputs.put(_DONE)
+
+    def close(self) -> None:
+        if not self.finished:
+            self.finished = True
+            self.runner._submit(self.runner.engine.abort(self.request_id))
+
+
+def benchmark_prefix_caching(model_path: str, system_prompt: str, prompts: List[str], runs: int = 3) -> Dict:
+    """
+    Mean prefill time (generation of one token) of prompts that share the system prompt, with and without
+    prefix caching. Each mode runs in its own process so that GPU memory is released between them.
+    """
+    import multiprocessing
+
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for enabled in (False, True):
+        with context.Pool(1) as pool:
+            results[enabled] = pool.apply(_prefill_times, (model_path, system_prompt, prompts, runs, enabled))
+    return {"without_caching_ms": results[False], "with_caching_ms": results[True],
+            "speedup": results[False] / results[True]}
+
+
+def _prefill_times(model_path: str, system_prompt: str, prompts: List[str], runs: int, enabled: bool) -> float:
+    from vllm import LLM
+
+    kwargs = {"enable_prefix_caching": True} if enabled else {}
+    llm = LLM(model=model_path, trust_remote_code=True, seed=42, **kwargs)
+    sampling_params = SamplingParams(temperature=0, max_tokens=1)
+    # первый запрос прогревает CUDA graphs и, при включенном кэше, заполняет блоки системного промпта
+    llm.generate(system_prompt + prompts[0], sampling_params, use_tqdm=False)
+    times = []
+    for _ in range(runs):
+        for prompt in prompts:
+            start = time.perf_counter()
+            llm.generate(system_prompt + prompt, sampling_params, use_tqdm=False)
+            times.append(time.perf_counter() - start)
+    return sum(times) / len(times) * 1000
+
+
+if __name__ == "__main__":
+    from utils.config import GenerationConfig
+
+    if not prefix_caching_supported():
+        raise SystemExit("Installed vLLM has no enable_prefix_caching, upgrade to >= 0.4 to run the benchmark")
+    system_prompt = "<s>[INST] " + GenerationConfig.system_prompt + "\n"
+    prompts = [f"Контекст: фрагмент документации номер {i}. " * 20 + f"Вопрос: как подключить платежи {i}? [/INST] "
+               for i in range(10)]
+    print(benchmark_prefix_caching('mistralai/Mistral-7B-Instruct-v0.2', system_prompt, prompts))